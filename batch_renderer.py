@@ -0,0 +1,71 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from image_wrapper import Image_wrapper
+
+class Batch_renderer:
+    """A class that renders many images as ascii-art across a pool of processes."""
+    # Number of worker processes (None means one per core).
+    max_workers = None
+
+    @staticmethod
+    def render(image_wrappers: list) -> list:
+        """Assumes image_wrappers is a list of Image_wrapper objects.
+        Renders every image not already in the render cache in a worker
+        process. Workers only receive the filename and render settings
+        and decode the image themselves, so images rendering from pixels
+        held in memory (thumbnails or replaced pixels) are rendered in this
+        process instead. Returns a list in the same
+        order as image_wrappers containing either the ascii-art string
+        or the exception that stopped that image from rendering.
+        """
+        results = [image_wrapper._load_cached_ascii_art() for image_wrapper in image_wrappers]
+        pending = []
+        for index, ascii_art in enumerate(results):
+            if ascii_art is not None:
+                continue
+            if image_wrappers[index]._renders_from_memory():
+                results[index] = Batch_renderer._render_one(image_wrappers[index])
+            else:
+                pending.append(index)
+        if not pending:
+            return results
+
+        if len(pending) == 1:
+            # Starting a pool costs more than it saves for a single image.
+            index = pending[0]
+            results[index] = Batch_renderer._render_one(image_wrappers[index])
+            return results
+
+        max_workers = min(Batch_renderer.max_workers or os.cpu_count() or 1,
+                          len(pending))
+        # The files are stat'ed before the workers read them, so a file
+        # replaced meanwhile isn't stored in the disk cache as the new file's render.
+        source_stats = {index: image_wrappers[index]._file_stat() for index in pending}
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {index: executor.submit(Image_wrapper._render_job_to_ascii_art,
+                                              image_wrappers[index]._render_job())
+                       for index in pending}
+            for index, future in futures.items():
+                try:
+                    ascii_art = future.result()
+                except Exception as e:
+                    # One bad image shouldn't abort the rest of the batch.
+                    results[index] = e
+                    continue
+                image_wrappers[index]._store_ascii_art(ascii_art,
+                                                       source_stat=source_stats[index])
+                results[index] = ascii_art
+        return results
+
+    @staticmethod
+    def _render_one(image_wrapper: Image_wrapper) -> str|Exception:
+        """Assumes image_wrapper is an Image_wrapper object that render
+        already looked up in the caches. Renders it in this process, stores
+        the render and returns the ascii-art or the exception.
+        """
+        try:
+            ascii_art = image_wrapper._convert_to_ascii_art()
+        except Exception as e:
+            return e
+        image_wrapper._store_ascii_art(ascii_art)
+        return ascii_art
@@ -0,0 +1,182 @@
+"""Benchmarks for loading, adjusting, converting, rendering and
+serializing images. Run from the repository root:
+
+    python -m benchmarks.benchmark [--output results.json] [--baseline baseline.json]
+
+Results are written as JSON and can be compared against a stored
+baseline, in which case the exit code is 1 if any stage got slower
+than the allowed tolerance.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from PIL import Image
+from image_collection import Image_collection
+from image_wrapper import Image_wrapper
+from serializer import Serializer
+
+# Sample images are copied from the repository root.
+REPOSITORY_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class Benchmark:
+    """A class that times every stage of the ascii-art pipeline."""
+    # Target widths every image is benchmarked at.
+    target_widths = (50, 200, 500)
+    # Synthetic images (filename, size) created next to the sample images.
+    synthetic_images = (("synthetic_large.jpg", (4000, 3000)),
+                        ("synthetic_large.png", (4000, 3000)))
+    sample_images = ("slalom.jpg", "stadshuset.jpg")
+
+    @staticmethod
+    def prepare_images(directory: str) -> list:
+        """Assumes directory is a string containing a path to an existing
+        directory. Copies the sample images there and creates the
+        synthetic ones. Returns a list of paths to the images, so that
+        benchmarks never overwrite the repository's images.
+        """
+        paths = []
+        for filename in Benchmark.sample_images:
+            path = os.path.join(directory, filename)
+            shutil.copyfile(os.path.join(REPOSITORY_DIRECTORY, filename), path)
+            paths.append(path)
+        for filename, size in Benchmark.synthetic_images:
+            path = os.path.join(directory, filename)
+            # A gradient compresses like a photo far better than noise does.
+            gradient = Image.linear_gradient("L")
+            bands = (gradient, gradient.transpose(Image.Transpose.ROTATE_90),
+                     gradient.transpose(Image.Transpose.FLIP_TOP_BOTTOM))
+            Image.merge("RGB", [band.resize(size) for band in bands]).save(path)
+            paths.append(path)
+        return paths
+
+    @staticmethod
+    def time_function(function, setup=None, repeat: int=5) -> dict:
+        """Assumes function and setup are callables taking no arguments.
+        Calls setup (untimed) and function repeat times. Returns a dict
+        with the best and median time in seconds.
+        """
+        timings = []
+        for _ in range(repeat):
+            if setup:
+                setup()
+            start = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - start)
+        return {"best": min(timings), "median": statistics.median(timings),
+                "repeat": repeat}
+
+    @staticmethod
+    def run(directory: str, repeat: int=5) -> list:
+        """Assumes directory is a string containing a path to an existing,
+        disposable directory. Benchmarks every stage for every image and
+        target width with directory as working directory, so rendered
+        files end up in it. Returns a list of result dicts.
+        """
+        working_directory = os.getcwd()
+        os.chdir(directory)
+        try:
+            return Benchmark._run_stages(Benchmark.prepare_images(directory), repeat)
+        finally:
+            os.chdir(working_directory)
+
+    @staticmethod
+    def _run_stages(image_paths: list, repeat: int) -> list:
+        """Assumes image_paths is a list of image paths and repeat is an
+        int. Returns a list of result dicts, one per stage, image and
+        target width.
+        """
+        results = []
+
+        def record(stage: str, image_path: str, width: int|None, timing: dict):
+            results.append({"stage": stage, "image": os.path.basename(image_path),
+                            "width": width, **timing})
+
+        for image_path in image_paths:
+            record("load", image_path, None,
+                   Benchmark.time_function(lambda: Image_wrapper(image_path, None), repeat=repeat))
+            for width in Benchmark.target_widths:
+                image_wrapper = Image_wrapper(image_path, None, width, 1.2, 1.1)
+                record("adjust", image_path, width,
+                       Benchmark.time_function(image_wrapper._prepare_grayscale_image,
+                                               repeat=repeat))
+                record("convert", image_path, width,
+                       Benchmark.time_function(image_wrapper._convert_to_ascii_art,
+                                               repeat=repeat))
+                record("render_to_file", image_path, width,
+                       Benchmark.time_function(
+                           lambda: image_wrapper.render_ascii_art_to_file("benchmark_render"),
+                           setup=Image_wrapper.render_cache.clear, repeat=repeat))
+
+        image_collection = Image_collection()
+        for image_path in image_paths:
+            image_collection.load_image(image_path, None)
+        session_path = "benchmark_session.json"
+
+        def remove_session():
+            if os.path.exists(session_path):
+                os.remove(session_path)
+
+        record("serialize", session_path, None,
+               Benchmark.time_function(lambda: Serializer.serialize(image_collection, session_path),
+                                       setup=remove_session, repeat=repeat))
+        record("deserialize", session_path, None,
+               Benchmark.time_function(lambda: Serializer.deserialize(session_path),
+                                       repeat=repeat))
+        return results
+
+    @staticmethod
+    def compare(results: list, baseline: list, tolerance: float) -> list:
+        """Assumes results and baseline are lists of result dicts and
+        tolerance is a float (e.g. 0.2 for 20 %). Returns a list of
+        (result, ratio) tuples for results slower than the baseline's
+        best time by more than tolerance.
+        """
+        baseline_times = {(result["stage"], result["image"], result["width"]): result["best"]
+                          for result in baseline}
+        regressions = []
+        for result in results:
+            baseline_time = baseline_times.get((result["stage"], result["image"], result["width"]))
+            if baseline_time and result["best"] > baseline_time * (1 + tolerance):
+                regressions.append((result, result["best"] / baseline_time))
+        return regressions
+
+def main():
+    """Runs the benchmarks and writes the results as JSON."""
+    parser = argparse.ArgumentParser(description="Benchmark the ascii-art pipeline.")
+    parser.add_argument("--output", help="file to write JSON results to (default: stdout)")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed slowdown against the baseline (default: 0.2)")
+    parser.add_argument("--repeat", type=int, default=5)
+    arguments = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = Benchmark.run(directory, arguments.repeat)
+    report = {"python": platform.python_version(),
+              "platform": platform.platform(),
+              "results": results}
+    if arguments.output:
+        with open(arguments.output, "w") as json_file:
+            json.dump(report, json_file, indent=4)
+    else:
+        json.dump(report, sys.stdout, indent=4)
+        print()
+
+    if arguments.baseline:
+        with open(arguments.baseline) as json_file:
+            baseline = json.load(json_file)["results"]
+        regressions = Benchmark.compare(results, baseline, arguments.tolerance)
+        for result, ratio in regressions:
+            print(f"Regression: {result['stage']} {result['image']} width={result['width']}"
+                  + f" is {ratio:.2f}x the baseline", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
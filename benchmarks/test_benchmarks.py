@@ -0,0 +1,52 @@
+import os
+import pytest
+from image_collection import Image_collection
+from image_wrapper import Image_wrapper
+from serializer import Serializer
+from benchmarks.benchmark import Benchmark
+
+# Requires the pytest-benchmark plugin, run with: python -m pytest benchmarks
+pytest.importorskip("pytest_benchmark")
+
+@pytest.fixture(scope="module")
+def image_paths(tmp_path_factory):
+    return Benchmark.prepare_images(str(tmp_path_factory.mktemp("images")))
+
+@pytest.fixture(autouse=True)
+def working_directory(tmp_path, monkeypatch):
+    # Rendered files and sessions end up in a temporary directory.
+    monkeypatch.chdir(tmp_path)
+
+@pytest.mark.parametrize("image_index", range(4))
+def test_load(benchmark, image_paths, image_index):
+    benchmark(Image_wrapper, image_paths[image_index], None)
+
+@pytest.mark.parametrize("width", Benchmark.target_widths)
+@pytest.mark.parametrize("image_index", range(4))
+def test_adjust(benchmark, image_paths, image_index, width):
+    image_wrapper = Image_wrapper(image_paths[image_index], None, width, 1.2, 1.1)
+    benchmark(image_wrapper._prepare_grayscale_image)
+
+@pytest.mark.parametrize("width", Benchmark.target_widths)
+@pytest.mark.parametrize("image_index", range(4))
+def test_convert(benchmark, image_paths, image_index, width):
+    image_wrapper = Image_wrapper(image_paths[image_index], None, width, 1.2, 1.1)
+    benchmark(image_wrapper._convert_to_ascii_art)
+
+@pytest.mark.parametrize("width", Benchmark.target_widths)
+def test_render_to_file(benchmark, image_paths, width):
+    image_wrapper = Image_wrapper(image_paths[0], None, width)
+    benchmark.pedantic(image_wrapper.render_ascii_art_to_file, args=("benchmark_render",),
+                       setup=Image_wrapper.render_cache.clear, rounds=10)
+
+def test_serialize_and_deserialize(benchmark, image_paths):
+    image_collection = Image_collection()
+    for image_path in image_paths:
+        image_collection.load_image(image_path, None)
+    session_path = "benchmark_session.json"
+
+    def serialize_and_deserialize():
+        Serializer.serialize(image_collection, session_path)
+        Serializer.deserialize(session_path)
+        os.remove(session_path)
+    benchmark(serialize_and_deserialize)
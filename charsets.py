@@ -0,0 +1,67 @@
+class Charset_registry:
+    """A class that keeps named character ramps and the lookup tables
+    compiled from them.
+    """
+    # Ramps ordered from dark to bright, by name. Every ramp is also
+    # registered reversed as '<name>_inverted' (for light backgrounds).
+    charsets = {
+        "standard": " `.-:+=*#%@",
+        "detailed": " .'`^\",:;Il!i><~+_-?][}{1)(|\\/tfjrxnuvczXYUJCLQ0OZmwqpdbkhao*#MW&8%B@$",
+        "blocks": " ░▒▓█",
+        "simple": " .:-=+*#%@",
+    }
+    charsets.update({f"{name}_inverted": chars[::-1] for name, chars in list(charsets.items())})
+    _tables = {}  # Compiled lookup tables by ramp, shared by every render.
+
+    @staticmethod
+    def register(name: str, chars: str):
+        """Assumes name is a string and chars is a string of 2 to 256
+        characters ordered from dark to bright. Registers chars (and its
+        inverted ramp) under name.
+        """
+        Charset_registry._validate(chars)
+        Charset_registry.charsets[name] = chars
+        Charset_registry.charsets[f"{name}_inverted"] = chars[::-1]
+
+    @staticmethod
+    def resolve(charset: str) -> str:
+        """Assumes charset is the name of a registered ramp or a ramp itself.
+        Returns the ramp's characters. Raises ValueError if charset is
+        neither a name nor a usable ramp.
+        """
+        chars = Charset_registry.charsets.get(charset.lower(), charset)
+        Charset_registry._validate(chars)
+        return chars
+
+    @staticmethod
+    def _validate(chars: str):
+        """Raises ValueError if chars can't be used as a ramp."""
+        if not 2 <= len(chars) <= 256 or "\n" in chars:
+            raise ValueError(chars)
+
+    @staticmethod
+    def ramp_index(grayscale: int, length: int) -> int:
+        """Assumes grayscale is an int from 0 to 255 and length is the
+        length of a ramp. Returns the index of grayscale's character.
+        Ramps that the original step of 256 // (length - 1) maps exactly
+        onto keep it, other ramps are spread evenly over the grayscale values.
+        """
+        step = 256 // (length - 1)
+        if 255 // step == length - 1:
+            return grayscale // step
+        return grayscale * length // 256
+
+    @staticmethod
+    def get_table(chars: str) -> bytes|str:
+        """Assumes chars is a ramp. Returns a 256 entry table mapping every
+        grayscale value to its character, compiled on first use. The table
+        is bytes for ascii ramps (for bytes.translate) and a string otherwise.
+        """
+        table = Charset_registry._tables.get(chars)
+        if table is None:
+            table = "".join(chars[Charset_registry.ramp_index(grayscale, len(chars))]
+                            for grayscale in range(256))
+            if table.isascii():
+                table = table.encode("ascii")
+            Charset_registry._tables[chars] = table
+        return table
@@ -0,0 +1,114 @@
+import html
+import re
+import numpy
+from PIL import Image
+
+class Color_renderer:
+    """A class that colors ascii-art with the colors of the image it was
+    made from, as ANSI escape codes for terminals or as HTML spans.
+    Neighbouring characters of the same color share one escape code or
+    span, and spaces take the color of the run they are in.
+    """
+    modes = ("none", "ansi256", "truecolor")
+    # Truecolor and html channels are rounded to multiples of this, so nearly equal colors merge into one run.
+    color_step = 16
+    _ansi_reset = "\x1b[0m"
+    # Channel values of the 6x6x6 color cube of the 256 color palette.
+    _cube_levels = numpy.array([0, 95, 135, 175, 215, 255])
+
+    @staticmethod
+    def colorize(ascii_art: str, color_image: Image.Image, mode: str) -> str:
+        """Assumes ascii_art is a string of lines, color_image is an Image
+        object with one pixel per character and mode is 'ansi256',
+        'truecolor' or 'html'. Returns ascii_art with every run of
+        characters of the same color wrapped in the mode's color codes.
+        """
+        lines = ascii_art.split("\n")
+        if mode == "ansi256":
+            color_keys = Color_renderer._ansi256_keys(color_image)
+        else:
+            color_keys = Color_renderer._rgb_keys(color_image)
+        color_keys = Color_renderer._merge_spaces(color_keys, lines)
+        if mode == "html":
+            start_code, end_code = "<i class=c{:06x}>", "</i>"  # Short tags, colors are in the page's css.
+        elif mode == "ansi256":
+            start_code, end_code = "\x1b[38;5;{}m", ""
+        else:
+            start_code, end_code = "\x1b[38;2;{};{};{}m", ""
+        colored_lines = []
+        for line, row_keys in zip(lines, color_keys):
+            # Runs start at the first column and wherever the color changes.
+            run_starts = [0] + (numpy.flatnonzero(row_keys[1:] != row_keys[:-1]) + 1).tolist()
+            run_ends = run_starts[1:] + [len(line)]
+            run_keys = row_keys[run_starts].tolist()
+            parts = []
+            for start, end, key in zip(run_starts, run_ends, run_keys):
+                text = line[start:end]
+                if mode == "html":
+                    parts.append(start_code.format(key) + html.escape(text) + end_code)
+                elif mode == "truecolor":
+                    parts.append(start_code.format(key >> 16, key >> 8 & 255, key & 255) + text)
+                else:
+                    parts.append(start_code.format(key) + text)
+            if mode != "html":
+                parts.append(Color_renderer._ansi_reset)
+            colored_lines.append("".join(parts))
+        return "\n".join(colored_lines)
+
+    @staticmethod
+    def html_document(colored_ascii_art: str, title: str) -> str:
+        """Assumes colored_ascii_art is a string from colorize in 'html'
+        mode and title is a string. Returns a self-contained html page
+        showing the ascii-art, with a css class for every color used.
+        """
+        colors = sorted(set(re.findall(r"<i class=c([0-9a-f]{6})>", colored_ascii_art)))
+        color_styles = "".join(f".c{color}{{color:#{color}}}" for color in colors)
+        return ("<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n"
+                + f"<title>{html.escape(title)}</title>\n"
+                + "<style>body { background: #000; } pre { font: 10px/1 monospace; }"
+                + f" i {{ font-style: normal; }}\n{color_styles}</style>\n"
+                + "</head>\n<body>\n<pre>\n" + colored_ascii_art + "\n</pre>\n</body>\n</html>\n")
+
+    @staticmethod
+    def _rgb_pixels(color_image: Image.Image) -> numpy.ndarray:
+        """Returns color_image's pixels as an int array of shape (height, width, 3)."""
+        if color_image.mode != "RGB":
+            color_image = color_image.convert(mode="RGB")
+        return numpy.asarray(color_image, dtype=numpy.int32)
+
+    @staticmethod
+    def _rgb_keys(color_image: Image.Image) -> numpy.ndarray:
+        """Returns an array of 0xRRGGBB ints with channels rounded to color_step."""
+        step = Color_renderer.color_step
+        pixels = numpy.minimum((Color_renderer._rgb_pixels(color_image) + step // 2)
+                               // step * step, 255)
+        return pixels[..., 0] << 16 | pixels[..., 1] << 8 | pixels[..., 2]
+
+    @staticmethod
+    def _ansi256_keys(color_image: Image.Image) -> numpy.ndarray:
+        """Returns an array of the nearest 256 color palette index of every
+        pixel, chosen from the color cube (16-231) and the gray ramp (232-255).
+        """
+        pixels = Color_renderer._rgb_pixels(color_image)
+        cube_indices = numpy.where(pixels < 48, 0, numpy.where(pixels < 115, 1, (pixels - 35) // 40))
+        cube_colors = Color_renderer._cube_levels[cube_indices]
+        gray_indices = numpy.clip((pixels.mean(axis=2).astype(numpy.int32) - 3) // 10, 0, 23)
+        gray_colors = (8 + 10 * gray_indices)[..., None]
+        cube_distances = ((pixels - cube_colors) ** 2).sum(axis=2)
+        gray_distances = ((pixels - gray_colors) ** 2).sum(axis=2)
+        cube_keys = 16 + 36 * cube_indices[..., 0] + 6 * cube_indices[..., 1] + cube_indices[..., 2]
+        return numpy.where(gray_distances < cube_distances, 232 + gray_indices, cube_keys)
+
+    @staticmethod
+    def _merge_spaces(color_keys: numpy.ndarray, lines: list) -> numpy.ndarray:
+        """Assumes color_keys is a 2D array with a key per character of
+        lines. Returns the keys with every space after the first column
+        given the key of the character before it, since its color isn't seen.
+        """
+        # utf-32 gives every character the same width, so the text maps straight onto the keys.
+        characters = numpy.frombuffer("".join(lines).encode("utf-32-le"), dtype=numpy.uint32)
+        is_space = (characters == ord(" ")).reshape(color_keys.shape)
+        is_space[:, 0] = False
+        columns = numpy.arange(color_keys.shape[1])
+        source_columns = numpy.maximum.accumulate(numpy.where(is_space, 0, columns), axis=1)
+        return numpy.take_along_axis(color_keys, source_columns, axis=1)
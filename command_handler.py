@@ -1,37 +1,78 @@
 import re
 from image_collection import Image_collection
+from image_wrapper import Image_wrapper
 from serializer import Serializer
+from live_preview import Live_preview
 import exceptions
 
 class Command_handler:
     # Initialize an instance of Image_collection to handle commands.
     image_collection = Image_collection()
+    # Live_preview object while preview is on, console renders then redraw in place.
+    live_preview = None
+    # Set to True in batch mode, so that 'quit' doesn't print into piped output.
+    quiet_exit = False
 
     # List of available commands.
     commands = [
         "load image 'filename'",
         "load image 'filename' as 'alias'",
+        "load image 'name_WIDTHxHEIGHT.raw' (8-bit grayscale, also '.pgm')",
+        "load images 'glob pattern'",
         "info",
         "render",
         "render 'filename/alias/current'",
         "render 'filename/alias/current' to 'filename'",
+        "render 'filename/alias/current' to 'filename.html' (colored html page)",
+        "render frames 'filename/alias/current' to 'directory'",
+        "play 'filename/alias/current'",
+        "play 'filename/alias/current' at 'fps' fps",
+        "render all",
+        "render all to 'directory'",
+        "watch 'filename/alias/current/all' (re-renders when the image's file changes)",
+        "watch 'filename/alias/current' to 'filename'",
+        "watch all to 'directory'",
+        "preview on/off (redraws changes in place, re-renders after 'set')",
         "set 'filename/alias' 'width' 'value' (Original value: 50)",
         "set 'filename/alias' 'height' 'value'",
         "set 'filename/alias' 'brightness' 'value' (Original value: 1.0)",
         "set 'filename/alias' 'contrast' 'value' (Original value: 1.0)",
+        "set 'filename/alias' 'charset' 'name/\"characters\"' (e.g. detailed, blocks, standard_inverted)",
+        "set 'filename/alias' 'dither' 'none/floyd-steinberg/atkinson/bayer' (Original value: none)",
+        "set 'filename/alias' 'color' 'none/ansi256/truecolor' (Original value: none)",
+        "set 'filename/alias' 'edges' 'on/off' (Original value: off)",
         "save session as 'filename'",
+        "save session as 'filename.aas' (binary session with thumbnails)",
         "load session 'filename'",
+        "load session 'filename.aas'",
+        "stats",
+        "stats on/off/reset",
+        "cache clear (removes the renders kept between runs)",
+        "stats export 'filename'",
         "quit/exit"
     ]
 
     # Dictionary mapping command names to regex patterns for parsing input.
     command_patterns = {
-        "load_image": re.compile(r'^load image (\S+\.(png|jpe?g))(?: as (\S+))?$', re.IGNORECASE),
+        "load_image": re.compile(r'^load image (\S+\.(png|jpe?g|gif|tiff?|pgm|raw))(?: as (\S+))?$', re.IGNORECASE),
+        "load_images": re.compile(r'^load images (\S+)$', re.IGNORECASE),
         "info": re.compile(r'^info$', re.IGNORECASE),
+        "render_frames": re.compile(r'^render frames (\S+) to (\S+)$', re.IGNORECASE),
+        "play": re.compile(r'^play (\S+)(?: at (\d+(\.\d+)?) fps)?$', re.IGNORECASE),
+        "render_all": re.compile(r'^render all(?: to (\S+))?$', re.IGNORECASE),
         "render": re.compile(r'^render(?: (\S+))?(?: to (\S+))?$', re.IGNORECASE),
+        "watch": re.compile(r'^watch (\S+)(?: to (\S+))?$', re.IGNORECASE),
         "set_image_attribute": re.compile(r'^set (\S+) (width|height|brightness|contrast) (\d+(\.\d+)?)$', re.IGNORECASE),
+        "set_charset": re.compile(r'^set (\S+) (charset) (\S+|"[^"\n]+")$', re.IGNORECASE),
+        "set_dither": re.compile(r'^set (\S+) (dither) (none|floyd-steinberg|atkinson|bayer)$', re.IGNORECASE),
+        "set_color": re.compile(r'^set (\S+) (color) (none|ansi256|truecolor)$', re.IGNORECASE),
+        "set_edges": re.compile(r'^set (\S+) (edges) (on|off)$', re.IGNORECASE),
+        "preview": re.compile(r'^preview (on|off)$', re.IGNORECASE),
         "save_session": re.compile(r'^save session as (\S+)$', re.IGNORECASE),
         "load_session": re.compile(r'^load session (\S+)$', re.IGNORECASE),
+        "stats": re.compile(r'^stats(?: (on|off|reset))?$', re.IGNORECASE),
+        "export_stats": re.compile(r'^stats export (\S+)$', re.IGNORECASE),
+        "clear_cache": re.compile(r'^cache clear$', re.IGNORECASE),
         'help': re.compile(r'^help$', re.IGNORECASE),
         'quit': re.compile(r'^(quit|exit)$', re.IGNORECASE)
     }
@@ -48,13 +89,33 @@ class Command_handler:
         if command_name == 'load_image':
             filename, alias = match.group(1), match.group(3)
             Command_handler._execute_load_image(filename, alias)
+        elif command_name == 'load_images':
+            pattern = match.group(1)
+            Command_handler._execute_load_images(pattern)
+            return
         elif command_name == 'info':
             Command_handler.image_collection.display_info()
             return
+        elif command_name == 'render_frames':
+            image_name, directory = match.group(1), match.group(2)
+            Command_handler._execute_render_frames(image_name, directory)
+            return
+        elif command_name == 'play':
+            image_name, fps = match.group(1), match.group(2)
+            Command_handler._execute_play(image_name, fps)
+            return
+        elif command_name == 'render_all':
+            directory = match.group(1)
+            Command_handler._execute_render_all(directory)
+            return
         elif command_name == 'render':
             image_name, filename = match.group(1), match.group(2)
             Command_handler._execute_render_ascii_art(image_name, filename)
             return
+        elif command_name == 'watch':
+            image_name, to_name = match.group(1), match.group(2)
+            Command_handler._execute_watch(image_name, to_name)
+            return
         elif command_name == 'set_image_attribute':
             image_name, attribute, value = (match.group(1), match.group(2),
                                             match.group(3))
@@ -62,6 +123,23 @@ class Command_handler:
                                                         attribute.lower(),
                                                         value)
             return
+        elif command_name == 'set_charset':
+            image_name, attribute, value = match.group(1, 2, 3)
+            if value.startswith('"') and value.endswith('"'):
+                value = value[1:-1]  # Quotes let a ramp start with a space.
+            Command_handler._execute_set_image_attribute(image_name,
+                                                         attribute.lower(),
+                                                         value)
+            return
+        elif command_name in ('set_dither', 'set_color', 'set_edges'):
+            image_name, attribute, value = match.group(1, 2, 3)
+            Command_handler._execute_set_image_attribute(image_name,
+                                                         attribute.lower(),
+                                                         value.lower())
+            return
+        elif command_name == 'preview':
+            Command_handler._execute_preview(match.group(1).lower() == "on")
+            return
         elif command_name == 'save_session':
             filename = match.group(1)
             Command_handler.execute_save_session(filename)
@@ -70,6 +148,17 @@ class Command_handler:
             filename = match.group(1)
             Command_handler._execute_load_session(filename)
             return
+        elif command_name == 'stats':
+            action = match.group(1)
+            Command_handler._execute_stats(action.lower() if action else None)
+            return
+        elif command_name == 'export_stats':
+            filename = match.group(1)
+            Command_handler._execute_export_stats(filename)
+            return
+        elif command_name == 'clear_cache':
+            Command_handler._execute_clear_cache()
+            return
         elif command_name == 'help':
             Command_handler._display_commands()
             return
@@ -101,6 +190,30 @@ class Command_handler:
         else:
             print(f"Successful load: '{filename}' is loaded")
 
+    @staticmethod
+    def _execute_load_images(pattern: str):
+        """Assumes pattern is a string containing a glob pattern. Loads
+        every matching image and displays how many loaded and a message
+        for each file that failed.
+        """
+        loaded_count, failures = Command_handler.image_collection.load_images(pattern)
+        print(f"Successful load: {loaded_count} of {loaded_count + len(failures)}"
+              + f" images matching '{pattern}' are loaded")
+        Command_handler._display_load_failures(failures)
+
+    @staticmethod
+    def _display_load_failures(failures: list):
+        """Assumes failures is a list of (filename, error) tuples.
+        Displays a message for each file that failed to load.
+        """
+        for filename, error in failures:
+            if isinstance(error, exceptions.InvalidInputError):
+                print(error)  # Already a complete message.
+                continue
+            if isinstance(error, FileNotFoundError):
+                error = "file not found"
+            print(f"-- Load failed: '{filename}' ({error}) --")
+
     @staticmethod
     def _execute_render_ascii_art(image_name: str,
                                filename: str|None):
@@ -109,10 +222,77 @@ class Command_handler:
         either to console or to a txt-file. Displays a message if it
         rendered successfuly to a file.
         """
+        if Command_handler.live_preview and not filename:
+            Command_handler.image_collection.render_ascii_art_to_preview(
+                image_name, Command_handler.live_preview)
+            return
         Command_handler.image_collection.render_ascii_art(image_name, filename)
-        if filename:
+        if filename and filename.lower().endswith(".html"):
+            print(f"Successful render: ASCII-art rendered to {filename}")
+        elif filename:
             print(f"Successful render: ASCII-art rendered to {filename}.txt")
 
+    @staticmethod
+    def _execute_render_frames(image_name: str, directory: str):
+        """Assumes image_name and directory are strings. Executes function
+        to render every frame of the image to txt-files. Displays a
+        message if it rendered successfully.
+        """
+        frame_count = Command_handler.image_collection.render_frames(image_name, directory)
+        print(f"Successful render: {frame_count} frames rendered to"
+              + f" ./ascii_images/{directory}/")
+
+    @staticmethod
+    def _execute_play(image_name: str, fps: str|None):
+        """Assumes image_name is a string and fps is a string or None.
+        Executes function to play the image's frames in the console.
+        """
+        if fps is not None and float(fps) <= 0:
+            raise exceptions.InvalidInputError("-- Invalid value: fps must be"
+                                               + " a positive number --")
+        Command_handler.image_collection.play_frames(image_name,
+                                                     float(fps) if fps else None)
+
+    @staticmethod
+    def _execute_render_all(directory: str|None):
+        """Assumes directory is a string or None. Executes function to
+        render every loaded image to txt-files. Displays a message for
+        the successful renders and one for each image that failed.
+        """
+        failures = Command_handler.image_collection.render_all(directory)
+        image_count = len(Command_handler.image_collection.images)
+        path = "./ascii_images/" + (directory + "/" if directory else "")
+        print(f"Successful render: {image_count - len(failures)} of {image_count}"
+              + f" images rendered to {path}")
+        for image_name, error in failures:
+            print(f"-- Render failed: '{image_name}' ({error}) --")
+
+    @staticmethod
+    def _execute_watch(image_name: str, to_name: str|None):
+        """Assumes image_name is a string and to_name is a string or None.
+        Executes function to render the image (or every image) again
+        whenever its file changes, until Ctrl+C. Displays a message for
+        every render to file and for every render that failed.
+        """
+        watched_renders = Command_handler.image_collection.watch(
+            image_name, to_name, Command_handler.live_preview)
+        if image_name.lower() == "all":
+            image_count = len(Command_handler.image_collection.images)
+        else:
+            image_count = 1
+        print(f"Watching {image_count} image{'s' if image_count != 1 else ''}"
+              + " for changes (Ctrl+C to stop)")
+        try:
+            for watched_name, error in watched_renders:
+                if error:
+                    print(f"-- Render failed: '{watched_name}' ({error}) --")
+                elif to_name:
+                    print(f"Successful render: '{watched_name}' rendered")
+        except KeyboardInterrupt:
+            print()
+        finally:
+            watched_renders.close()
+
     @staticmethod
     def _execute_set_image_attribute(image_name: str,
                                   attribute: str,
@@ -125,18 +305,34 @@ class Command_handler:
         Command_handler.image_collection.set_image_attribute(image_name, 
                                                              attribute, 
                                                              value)
+        if Command_handler.live_preview:
+            # Show the effect right away, only the changed cells are redrawn.
+            Command_handler.image_collection.render_ascii_art_to_preview(
+                image_name, Command_handler.live_preview)
         print(f"Successful alteration: {attribute.capitalize()} of "
               + f"'{image_name}' is now set to '{value}'")
     
+    @staticmethod
+    def _execute_preview(turn_on: bool):
+        """Assumes turn_on is a bool. Turns the live preview on or off."""
+        if turn_on:
+            Command_handler.live_preview = Live_preview()
+            print("Live preview: Renders to console now redraw in place")
+        else:
+            Command_handler.live_preview = None
+            print("Live preview: Off")
+
     @staticmethod
     def execute_save_session(filename: str):
         """Assumes image_collection is an Image_collection object and
         filename is a string. Calls the function that saves the images to disk and the 
-        current session to specified json-file. Displays a message if
-        the current session saved as intended.
+        current session to specified json-file, or to a binary session if
+        filename ends with '.aas'. Displays a message if the current
+        session saved as intended.
         """
-        Serializer.serialize(Command_handler.image_collection, filename + ".json")
-        print(f"Successful save: Session is saved as '{filename}.json'")
+        filename = Command_handler._session_filename(filename)
+        Serializer.serialize(Command_handler.image_collection, filename)
+        print(f"Successful save: Session is saved as '{filename}'")
 
     @staticmethod
     def _execute_load_session(filename: str):
@@ -144,15 +340,67 @@ class Command_handler:
         is a string. Calls the function that loads a saved session. All images
         in the current session will be replaced with the loaded sessions images.
         An exception is thrown if the data from specified json-file is invalid.
-        Displays a message if the session load was successful.
+        Displays a message if the session load was successful and one for
+        each image that failed to load.
         """
+        filename = Command_handler._session_filename(filename)
+        failures = []
         try:
-            Command_handler.image_collection = Serializer.deserialize(filename + ".json")
-        except IndexError:
-            raise exceptions.SessionLoadError(f"-- Load failed: '{filename}.json'"
+            Command_handler.image_collection = Serializer.deserialize(filename, failures)
+        except (IndexError, KeyError):
+            raise exceptions.SessionLoadError(f"-- Load failed: '{filename}'"
                                               + " contain invalid data --")
-        print(f"Successful load: '{filename}.json' loaded as current session")
+        print(f"Successful load: '{filename}' loaded as current session")
+        Command_handler._display_load_failures(failures)
+
+    @staticmethod
+    def _session_filename(filename: str) -> str:
+        """Assumes filename is a string. Returns filename with suffix
+        '.json' added unless it names a binary session.
+        """
+        if filename.endswith(Serializer.binary_suffix):
+            return filename
+        return filename + ".json"
     
+    @staticmethod
+    def _execute_stats(action: str|None):
+        """Assumes action is 'on', 'off', 'reset' or None. Turns collection
+        of render stats on or off, resets them or displays them.
+        """
+        render_stats = Image_wrapper.render_stats
+        if action == "on":
+            render_stats.enabled = True
+            print("Render stats: Collection is on")
+        elif action == "off":
+            render_stats.enabled = False
+            print("Render stats: Collection is off")
+        elif action == "reset":
+            render_stats.reset()
+            Image_wrapper.render_cache.reset_counters()
+            print("Render stats: Collected stats are reset")
+        else:
+            render_stats.display(Image_wrapper.render_cache)
+
+    @staticmethod
+    def _execute_export_stats(filename: str):
+        """Assumes filename is a string. Writes the collected render stats
+        to specified json-file. Displays a message if the export succeeds.
+        """
+        Image_wrapper.render_stats.export(Image_wrapper.render_cache, filename + ".json")
+        print(f"Successful export: Render stats are saved as '{filename}.json'")
+
+    @staticmethod
+    def _execute_clear_cache():
+        """Removes every render from the render cache and the disk cache.
+        Displays a message when done.
+        """
+        Image_wrapper.render_cache.clear()
+        if Image_wrapper.disk_cache:
+            Image_wrapper.disk_cache.clear()
+            print(f"Cache: Renders in {Image_wrapper.disk_cache.directory} are removed")
+        else:
+            print("Cache: Renders are removed (no disk cache in use)")
+
     @staticmethod
     def _display_commands():
         """Displays all available commands."""
@@ -163,5 +411,6 @@ class Command_handler:
     @staticmethod
     def _exit_program():
         """Turns off the program."""
-        print("Program shutting down...")
+        if not Command_handler.quiet_exit:
+            print("Program shutting down...")
         exit(0)
\ No newline at end of file
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+import tempfile
+
+class Disk_cache:
+    """A class representing a render cache in a directory, shared by
+    every process and run using the same directory. Renders are stored
+    by a hash of the source file's bytes and the render settings, written
+    atomically, and the least recently used renders are removed once the
+    directory holds more than max_bytes. The digests of source files are
+    recorded next to the renders, so they are counted and evicted alike.
+    """
+    # Part of every key, increase when rendering changes so old renders aren't used.
+    version = 1
+
+    def __init__(self, directory: str, max_bytes: int=100_000_000):
+        """Constructs an objects necessary attributes."""
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._used_bytes = None  # Counted on the first store, then kept up to date.
+        self._source_digests = {}  # (path, mtime, size) -> digest, for this process.
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def directory(self):
+        """Returns the cache directory."""
+        return self._directory
+
+    @property
+    def hits(self):
+        """Returns the number of lookups that found a cached render."""
+        return self._hits
+
+    @property
+    def misses(self):
+        """Returns the number of lookups that found no cached render."""
+        return self._misses
+
+    def source_digest(self, filename: str, persist: bool=True) -> str:
+        """Assumes filename is a string and persist is a bool. Returns the
+        sha256 hex digest of the file's bytes. A file with the same path,
+        modification time and size as one hashed before (by any process)
+        isn't read again. If persist is False, as for temporary files that
+        are never seen again, the digest isn't recorded.
+        """
+        file_stat = os.stat(filename)
+        stat_key = (os.path.realpath(filename), file_stat.st_mtime_ns, file_stat.st_size)
+        digest = self._source_digests.get(stat_key)
+        if digest:
+            return digest
+        stat_path = self._path("sources", hashlib.sha256(repr(stat_key).encode()).hexdigest())
+        try:
+            with open(stat_path) as stat_file:
+                digest = stat_file.read()
+            os.utime(stat_path)  # Mark as most recently used.
+        except FileNotFoundError:
+            file_hash = hashlib.sha256()
+            with open(filename, "rb") as source_file:
+                while chunk := source_file.read(1 << 20):
+                    file_hash.update(chunk)
+            digest = file_hash.hexdigest()
+            if not persist:
+                return digest
+            self._store(stat_path, digest)
+        self._source_digests[stat_key] = digest
+        return digest
+
+    def make_key(self, source_digest: str, settings: tuple) -> str:
+        """Assumes source_digest is a string from source_digest and settings
+        is a tuple of json serializable render settings. Returns the key
+        of the render.
+        """
+        key_data = json.dumps([Disk_cache.version, source_digest, settings])
+        return hashlib.sha256(key_data.encode()).hexdigest()
+
+    def get(self, key: str) -> str|None:
+        """Assumes key is a string from make_key. Returns the cached
+        ascii-art or None if it isn't cached.
+        """
+        render_path = self._path("renders", key)
+        try:
+            with open(render_path, encoding="utf-8", newline="") as render_file:
+                ascii_art = render_file.read()
+            os.utime(render_path)  # Mark as most recently used.
+        except FileNotFoundError:
+            # Not cached, or evicted by another process while being read.
+            self._misses += 1
+            return None
+        self._hits += 1
+        return ascii_art
+
+    def put(self, key: str, ascii_art: str):
+        """Assumes key is a string from make_key and ascii_art is a string.
+        Stores ascii_art and evicts the least recently used renders if the
+        cache has grown past max_bytes.
+        """
+        self._store(self._path("renders", key), ascii_art)
+
+    def clear(self):
+        """Removes every cached render and source digest and resets the counters."""
+        for render_path, _, _ in self._list_renders():
+            self._remove(render_path)
+        self._source_digests.clear()
+        self._used_bytes = 0
+        self._hits = 0
+        self._misses = 0
+
+    def _store(self, path: str, text: str):
+        """Assumes path is a path from _path and text is a string. Writes
+        text and evicts the least recently used files if the cache has
+        grown past max_bytes.
+        """
+        byte_count = self._write_atomically(path, text)
+        if self._used_bytes is None:
+            self._used_bytes = sum(size for _, size, _ in self._list_renders())
+        else:
+            self._used_bytes += byte_count
+        if self._used_bytes > self._max_bytes:
+            self._evict()
+
+    def _evict(self):
+        """Removes the least recently used files until the cache holds
+        at most 90% of max_bytes. Other processes may evict at the same
+        time, so the renders are counted again first.
+        """
+        renders = sorted(self._list_renders(), key=lambda render: render[2])
+        self._used_bytes = sum(size for _, size, _ in renders)
+        for render_path, size, _ in renders:
+            if self._used_bytes <= self._max_bytes * 0.9:
+                break
+            self._remove(render_path)
+            self._used_bytes -= size
+
+    def _list_renders(self) -> list:
+        """Returns a list of (path, size, modification time) tuples of
+        every cached render and source digest.
+        """
+        renders = []
+        renders_directory = os.path.join(self._directory, "renders")
+        if not os.path.isdir(renders_directory):
+            return renders
+        for subdirectory in os.scandir(renders_directory):
+            for entry in os.scandir(subdirectory.path):
+                try:
+                    entry_stat = entry.stat()
+                except FileNotFoundError:
+                    continue  # Evicted by another process.
+                if entry.name.endswith((".txt", ".digest")):
+                    renders.append((entry.path, entry_stat.st_size, entry_stat.st_mtime_ns))
+        return renders
+
+    def _path(self, kind: str, key: str) -> str:
+        """Returns the path of key's file, spread over subdirectories by
+        its first characters. Source digests are kept with the renders.
+        """
+        suffix = ".txt" if kind == "renders" else ".digest"
+        return os.path.join(self._directory, "renders", key[:2], key + suffix)
+
+    @staticmethod
+    def _remove(path: str):
+        """Removes path unless another process already did."""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _write_atomically(path: str, text: str) -> int:
+        """Assumes path and text are strings. Writes text to a temporary
+        file next to path and renames it into place, so readers never see
+        a partly written file. Returns the number of bytes written.
+        """
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        data = text.encode("utf-8")
+        with tempfile.NamedTemporaryFile("wb", dir=directory, suffix=".tmp",
+                                         delete=False) as temporary_file:
+            try:
+                temporary_file.write(data)
+            except OSError:
+                temporary_file.close()
+                os.remove(temporary_file.name)
+                raise
+        os.replace(temporary_file.name, path)
+        return len(data)
@@ -0,0 +1,52 @@
+import numpy
+from PIL import Image
+
+class Edge_detector:
+    """A class that finds strong edges in a grayscale image with Sobel
+    gradients and draws them over ascii-art with directional glyphs.
+    """
+    # Gradient magnitude (Sobel, grayscale 0-255) above which a pixel is drawn as an edge.
+    threshold = 320
+    # Glyphs for vertical, rising diagonal, horizontal and falling diagonal edges.
+    glyphs = "|/-\\"
+
+    @staticmethod
+    def overlay(ascii_art: str, grayscale_image: Image.Image, top: int=0) -> str:
+        """Assumes ascii_art is a string of lines with one character per
+        pixel of grayscale_image, a grayscale Image object, from row top on
+        (rows around the lines let edges at their borders be found).
+        Returns ascii_art with the characters on strong edges replaced by glyphs.
+        """
+        height = ascii_art.count("\n") + 1
+        edge_glyphs = Edge_detector.detect(grayscale_image)[top:top + height]
+        width = edge_glyphs.shape[1]
+        # utf-32 gives every character the same width, so each line (with its newline) is a row.
+        characters = numpy.frombuffer((ascii_art + "\n").encode("utf-32-le"),
+                                      dtype=numpy.uint32).reshape(height, width + 1).copy()
+        lines = characters[:, :width]
+        numpy.copyto(lines, edge_glyphs, where=edge_glyphs != 0)
+        return characters.tobytes().decode("utf-32-le")[:-1]  # Without the added newline.
+
+    @staticmethod
+    def detect(grayscale_image: Image.Image) -> numpy.ndarray:
+        """Assumes grayscale_image is a grayscale Image object. Returns a
+        uint32 array of the same size holding the code point of the edge
+        glyph of every pixel on a strong edge and 0 elsewhere.
+        """
+        pixels = numpy.pad(numpy.asarray(grayscale_image, dtype=numpy.float32), 1, mode="edge")
+        # Sobel kernels as sums of shifted views, rows and columns of the padded image.
+        top, middle, bottom = pixels[:-2], pixels[1:-1], pixels[2:]
+        vertical_sum = top + 2 * middle + bottom
+        gradient_x = vertical_sum[:, 2:] - vertical_sum[:, :-2]
+        horizontal_sum = pixels[:, :-2] + 2 * pixels[:, 1:-1] + pixels[:, 2:]
+        gradient_y = horizontal_sum[2:] - horizontal_sum[:-2]
+        strong_edges = gradient_x ** 2 + gradient_y ** 2 > Edge_detector.threshold ** 2
+        # The edge runs across the gradient (y pointing down): a mostly horizontal
+        # gradient makes a vertical edge, equal signs a rising diagonal.
+        tan_22_5 = 0.41421356
+        absolute_x, absolute_y = numpy.abs(gradient_x), numpy.abs(gradient_y)
+        direction = numpy.where(absolute_y < tan_22_5 * absolute_x, 0,
+                                numpy.where(absolute_x < tan_22_5 * absolute_y, 2,
+                                            numpy.where(gradient_x * gradient_y > 0, 1, 3)))
+        glyph_codes = numpy.array([ord(glyph) for glyph in Edge_detector.glyphs], dtype=numpy.uint32)
+        return numpy.where(strong_edges, glyph_codes[direction], 0).astype(numpy.uint32)
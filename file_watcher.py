@@ -0,0 +1,55 @@
+import os
+import time
+
+class File_watcher:
+    """A class that polls files for changes. A change is reported once
+    the file has stayed the same for debounce seconds, so a burst of
+    writes (or a file being replaced) is reported once, when complete.
+    Polling costs one os.stat per file.
+    """
+    # Seconds between polls while watching.
+    poll_interval = 0.5
+    # Seconds a changed file must stay unchanged before it's reported.
+    debounce = 0.3
+
+    def __init__(self, filenames: list):
+        """Constructs an objects necessary attributes. Assumes filenames
+        is a list of strings, their current state being unchanged.
+        """
+        self._signatures = {filename: File_watcher._signature(filename)
+                            for filename in filenames}
+        self._changing = {}  # filename -> (latest signature, time it was first seen)
+
+    @staticmethod
+    def _signature(filename: str) -> tuple|None:
+        """Returns a tuple that changes whenever the file is written or
+        replaced, or None if the file doesn't exist.
+        """
+        try:
+            file_stat = os.stat(filename)
+        except FileNotFoundError:
+            return None
+        return (file_stat.st_mtime_ns, file_stat.st_size, file_stat.st_ino)
+
+    def poll(self, now: float|None=None) -> list:
+        """Assumes now is None or a time.monotonic() value. Returns a list
+        of the filenames that changed and have since stayed unchanged for
+        debounce seconds (and exist). They count as unchanged afterwards.
+        """
+        if now is None:
+            now = time.monotonic()
+        changed_filenames = []
+        for filename, signature in self._signatures.items():
+            current_signature = File_watcher._signature(filename)
+            if current_signature == signature:
+                self._changing.pop(filename, None)  # Changed back, e.g. a write that was undone.
+                continue
+            latest_signature, first_seen = self._changing.get(filename, (None, None))
+            if first_seen is None or latest_signature != current_signature:
+                # Still being written, wait until it settles.
+                self._changing[filename] = (current_signature, now)
+            elif now - first_seen >= File_watcher.debounce and current_signature:
+                changed_filenames.append(filename)
+                self._signatures[filename] = current_signature
+                del self._changing[filename]
+        return changed_filenames
@@ -1,13 +1,25 @@
+import glob
+import os.path
+import time
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 from image_wrapper import Image_wrapper
+from batch_renderer import Batch_renderer
+from file_watcher import File_watcher
 import exceptions
 
 class Image_collection:
     """A class representing a collection of images"""
+    # Number of threads opening images at once (Pillow releases the GIL while decoding).
+    load_workers = 8
+
     def __init__(self):
         """Constructs an objects necessary attributes."""
         self._images = []
         self._current_image = None
+        # Indexes for constant time lookups by filename and alias.
+        self._images_by_filename = {}
+        self._images_by_alias = {}
 
     @property
     def images(self):
@@ -34,13 +46,62 @@ class Image_collection:
         image_wrapper = Image_wrapper(filename, alias)
     
         # Adding instance to the collection and set it to current image.
-        self._images.append(image_wrapper)
+        self.add_image_to_collection(image_wrapper)
         self._current_image = image_wrapper
 
+    def load_images(self, pattern: str) -> tuple:
+        """Assumes pattern is a string containing a glob pattern. Loads
+        every matching file concurrently, in sorted filename order. Files
+        that are already loaded or fail to open don't stop the rest.
+        Returns a tuple with the number of loaded images and a list of
+        (filename, error) tuples for the files that failed.
+        """
+        filenames = sorted(glob.glob(pattern))
+        if not filenames:
+            raise exceptions.ImageNotFoundError(f"-- No images found: '{pattern}'"
+                                                + " matches no files --")
+        failures, new_filenames = [], []
+        for filename in filenames:
+            try:
+                self._check_filename_existance(filename)
+            except exceptions.InvalidInputError as e:
+                failures.append((filename, e))
+                continue
+            new_filenames.append(filename)
+
+        image_wrappers = Image_collection.create_image_wrappers(
+            [(filename, None) for filename in new_filenames])
+        loaded_count = 0
+        for filename, image_wrapper in zip(new_filenames, image_wrappers):
+            if isinstance(image_wrapper, Exception):
+                failures.append((filename, image_wrapper))
+                continue
+            self.add_image_to_collection(image_wrapper)
+            self._current_image = image_wrapper
+            loaded_count += 1
+        return loaded_count, failures
+
+    @staticmethod
+    def create_image_wrappers(arguments_list: list) -> list:
+        """Assumes arguments_list is a list of tuples with Image_wrapper
+        arguments. Creates the Image_wrapper objects on a pool of threads.
+        Returns a list in the same order containing either the
+        Image_wrapper object or the exception raised while creating it.
+        """
+        def create_image_wrapper(arguments: tuple):
+            try:
+                return Image_wrapper(*arguments)
+            except Exception as e:
+                return e
+
+        if len(arguments_list) < 2:
+            return [create_image_wrapper(arguments) for arguments in arguments_list]
+        with ThreadPoolExecutor(max_workers=Image_collection.load_workers) as executor:
+            return list(executor.map(create_image_wrapper, arguments_list))
+
     def _check_filename_existance(self, filename: str):
         """Throws exception if given filename is already loaded."""
-        loaded_filenames = [image_wrapper.filename for image_wrapper in self.images]
-        if filename in loaded_filenames:
+        if filename in self._images_by_filename:
             raise exceptions.InvalidInputError("-- Load failed: "
                                                + f"'{filename}'"
                                                + f" is already "
@@ -48,18 +109,17 @@ class Image_collection:
 
     def _validate_alias(self, alias: str|None):
         """Validates given alias and throws exception if it already exist
-        or is 'current'.
+        or is 'current' or 'all'.
         """
         if not alias:
             # Alias is optional and None is therefore valid.
             return
-        elif alias.casefold() == "current":
-            # 'current' is an invalid alias.
+        elif alias.casefold() in ("current", "all"):
+            # 'current' and 'all' are invalid aliases, commands use them as image names.
             raise exceptions.InvalidInputError("-- Load failed: "
                                                + "An alias cannot "
                                                + f"be '{alias}' --")
-        loaded_aliases = [image_wrapper.alias for image_wrapper in self.images]
-        if alias in loaded_aliases:
+        if alias in self._images_by_alias:
             # Specified alias already exist.
             raise exceptions.InvalidInputError("-- Load failed:"
                                                f" '{alias}' "
@@ -83,7 +143,11 @@ class Image_collection:
             print(f"{"size: ":>9}{image_wrapper.size}")
             print(f"{"target size: ":>16}{image_wrapper.target_size}")
             print(f"{"brightness: ":>15}{image_wrapper.brightness}")
-            print(f"{"contrast: ":>13}{image_wrapper.contrast}\n")
+            print(f"{"contrast: ":>13}{image_wrapper.contrast}")
+            print(f"{"charset: ":>12}{image_wrapper.charset!r}")
+            print(f"{"dither: ":>11}{image_wrapper.dither}")
+            print(f"{"color: ":>10}{image_wrapper.color}")
+            print(f"{"edges: ":>10}{"on" if image_wrapper.edges else "off"}\n")
 
         # Display alias or filename of the current image.
         print("Current image: ", end="")
@@ -91,6 +155,14 @@ class Image_collection:
             print(image_alias)
         else:
             print(image_filename)
+
+        render_cache = Image_wrapper.render_cache
+        print(f"Render cache: {render_cache.hits} hits, {render_cache.misses} misses"
+              + f" ({len(render_cache)}/{render_cache.max_entries} renders cached)")
+        disk_cache = Image_wrapper.disk_cache
+        if disk_cache:
+            print(f"Disk cache: {disk_cache.hits} hits, {disk_cache.misses} misses"
+                  + f" ({disk_cache.directory})")
     
     def render_ascii_art(self, image_name: str|None,
                          to_filename: str|None):
@@ -118,6 +190,166 @@ class Image_collection:
             image_wrapper.render_ascii_art_to_console()
         self._current_image = image_wrapper
 
+    def render_ascii_art_to_preview(self, image_name: str|None, live_preview):
+        """Assumes image_name is None or a string and live_preview is a
+        Live_preview object. Redraws the image's ascii-art in the live
+        preview, the current image if image_name is None.
+        """
+        self.check_empty_image_collection()
+        if not image_name:
+            image_wrapper = self._current_image
+        else:
+            image_wrapper = self._find_image_wrapper_or_current(image_name)
+        image_wrapper.render_ascii_art_to_preview(live_preview)
+        self._current_image = image_wrapper
+
+    def render_all(self, to_directory: str|None,
+                   pattern: str|None=None) -> list:
+        """Assumes to_directory and pattern are None or strings. Renders
+        every loaded image, or every file matching the glob pattern, to
+        txt-files in ./ascii_images/ or ./ascii_images/to_directory/.
+        Files are named after the image's alias or filename and written
+        in collection (or sorted filename) order. Images that fail don't
+        stop the rest. Returns a list of (image name, error) tuples for
+        the images that failed.
+        """
+        if pattern is None:
+            self.check_empty_image_collection()
+            image_wrappers, failures = list(self._images), []
+        else:
+            image_wrappers, failures = self._wrap_matching_files(pattern)
+
+        output_names = self._make_output_names(image_wrappers)
+        ascii_arts = Batch_renderer.render(image_wrappers)
+        for image_wrapper, output_name, ascii_art in zip(image_wrappers,
+                                                         output_names,
+                                                         ascii_arts):
+            if isinstance(ascii_art, Exception):
+                failures.append((image_wrapper.alias or image_wrapper.filename,
+                                 ascii_art))
+                continue
+            if to_directory:
+                output_name = os.path.join(to_directory, output_name)
+            with image_wrapper._make_directory_and_open_w(output_name + ".txt") as text_file:
+                print(ascii_art, file=text_file)
+        return failures
+
+    def _wrap_matching_files(self, pattern: str) -> tuple:
+        """Assumes pattern is a string containing a glob pattern. Returns
+        a tuple with a list of Image_wrapper objects for matching files,
+        loaded ones included with their settings, and a list of (filename,
+        error) tuples for files that couldn't be opened.
+        """
+        image_wrappers, failures = [], []
+        for filename in sorted(glob.glob(pattern)):
+            try:
+                image_wrappers.append(self._find_image_wrapper(filename))
+            except exceptions.ImageNotFoundError:
+                try:
+                    image_wrappers.append(Image_wrapper(filename, None, lazy=True))
+                except Exception as e:
+                    failures.append((filename, e))
+        if not image_wrappers and not failures:
+            raise exceptions.ImageNotFoundError(f"-- No images found: '{pattern}'"
+                                                + " matches no files --")
+        return image_wrappers, failures
+
+    @staticmethod
+    def _make_output_names(image_wrappers: list) -> list:
+        """Assumes image_wrappers is a list of Image_wrapper objects.
+        Returns a list of unique output names, the alias or the filename
+        without suffix, numbered if several images share a name.
+        """
+        output_names, used_names = [], set()
+        for image_wrapper in image_wrappers:
+            name = image_wrapper.alias or os.path.splitext(
+                os.path.basename(image_wrapper.filename))[0]
+            output_name, number = name, 1
+            while output_name in used_names:
+                number += 1
+                output_name = f"{name}_{number}"
+            used_names.add(output_name)
+            output_names.append(output_name)
+        return output_names
+
+    def play_frames(self, image_name: str, fps: float|None):
+        """Assumes image_name is a string and fps is None or a positive
+        float. Plays every frame of the image as ascii-art in the console.
+        """
+        self.check_empty_image_collection()
+        image_wrapper = self._find_image_wrapper_or_current(image_name)
+        image_wrapper.play_frames(fps)
+        self._current_image = image_wrapper
+
+    def render_frames(self, image_name: str, to_directory: str) -> int:
+        """Assumes image_name and to_directory are strings. Renders every
+        frame of the image as ascii-art to txt-files in to_directory.
+        Returns the number of frames rendered.
+        """
+        self.check_empty_image_collection()
+        image_wrapper = self._find_image_wrapper_or_current(image_name)
+        frame_count = image_wrapper.render_frames_to_directory(to_directory)
+        self._current_image = image_wrapper
+        return frame_count
+
+    def watch(self, image_name: str, to_name: str|None, live_preview=None):
+        """Assumes image_name is a string (an image or 'all'), to_name is
+        None or a string and live_preview is None or a Live_preview object.
+        Renders the images, then polls their files and reloads and renders
+        again only the images whose file changed. A single image is rendered
+        to the file to_name, 'all' to txt-files in the directory to_name,
+        and without to_name to the console (or the live preview). Yields a
+        tuple (image name, error) after each render, error being None if it
+        succeeded. Runs until the generator is closed.
+        """
+        self.check_empty_image_collection()
+        if image_name.lower() == "all":
+            image_wrappers = list(self._images)
+            if to_name:
+                output_names = [os.path.join(to_name, output_name)
+                                for output_name in self._make_output_names(image_wrappers)]
+            else:
+                output_names = [None] * len(image_wrappers)
+        else:
+            image_wrappers = [self._find_image_wrapper_or_current(image_name)]
+            output_names = [to_name]
+            self._current_image = image_wrappers[0]
+        outputs = {}  # filename -> list of (Image_wrapper, output name) tuples.
+        for image_wrapper, output_name in zip(image_wrappers, output_names):
+            outputs.setdefault(image_wrapper.filename, []).append((image_wrapper, output_name))
+
+        file_watcher = File_watcher(list(outputs))
+        changed_filenames, reload = list(outputs), False  # Render everything once to start with.
+        while True:
+            for filename in changed_filenames:
+                for image_wrapper, output_name in outputs[filename]:
+                    yield (image_wrapper.alias or filename,
+                           self._render_watched_image(image_wrapper, output_name,
+                                                      live_preview, reload))
+            time.sleep(File_watcher.poll_interval)
+            changed_filenames, reload = file_watcher.poll(), True
+
+    @staticmethod
+    def _render_watched_image(image_wrapper: Image_wrapper, output_name: str|None,
+                              live_preview, reload: bool) -> Exception|None:
+        """Reloads image_wrapper from file if reload is True and renders it
+        to output_name, or to the console (or the live preview) if it is
+        None. Returns None, or the error if the image couldn't be reloaded
+        or rendered, e.g. as its file was only partly written.
+        """
+        try:
+            if reload:
+                image_wrapper.reload()
+            if output_name:
+                image_wrapper.render_ascii_art_to_file(output_name)
+            elif live_preview:
+                image_wrapper.render_ascii_art_to_preview(live_preview)
+            else:
+                image_wrapper.render_ascii_art_to_console()
+        except Exception as e:
+            return e
+        return None
+
     # Set attribute functionality:
     def set_image_attribute(self, image_name: str,
                             attribute: str, value: str):
@@ -148,11 +380,22 @@ class Image_collection:
             image_wrapper.brightness = value  # can't throw ValueError because of regex pattern.
         elif attribute == "contrast":
             image_wrapper.contrast = value  # can't throw ValueError because of regex pattern.
+        elif attribute == "charset":
+            image_wrapper.charset = value
+        elif attribute == "dither":
+            image_wrapper.dither = value
+        elif attribute == "color":
+            image_wrapper.color = value
+        elif attribute == "edges":
+            image_wrapper.edges = value.lower() == "on"  # can't be anything but on/off because of regex pattern.
         self._current_image = image_wrapper
 
     def add_image_to_collection(self, image: Image):
-        """Assumes image is an Image object and adds it to the list of loaded images."""
+        """Assumes image is an Image_wrapper object and adds it to the list of loaded images."""
         self._images.append(image)
+        self._images_by_filename[image.filename] = image
+        if image.alias:
+            self._images_by_alias[image.alias] = image
 
     def _find_image_wrapper(self, image_name: str) -> Image_wrapper:
         """Assumes image_name is a string containing a potential filename
@@ -160,14 +403,22 @@ class Image_collection:
         images). Returns the sought after Image_wrapper object with
         filename or alias equal to image_name.
         """
-        for image_wrapper in self._images:
-            if (image_wrapper.filename == image_name 
-                    or image_wrapper.alias == image_name):
-                # Image_wrapper found.
-                return image_wrapper
+        image_wrapper = (self._images_by_filename.get(image_name)
+                         or self._images_by_alias.get(image_name))
+        if image_wrapper:
+            # Image_wrapper found.
+            return image_wrapper
         raise exceptions.ImageNotFoundError(f"-- Image is not loaded: '{image_name}'"
                                             + " cannot be found --")
     
+    def _find_image_wrapper_or_current(self, image_name: str) -> Image_wrapper:
+        """Assumes image_name is a string containing a filename, alias or
+        'current'. Returns the sought after Image_wrapper object.
+        """
+        if image_name.lower() == "current":
+            return self._current_image
+        return self._find_image_wrapper(image_name)
+    
     def check_empty_image_collection(self):
         """Checks if list (image collection) is empty and throws exception if it is."""
         if not self._images:
@@ -1,29 +1,169 @@
+import math
 import os, os.path
-from PIL import Image, ImageEnhance
+import time
+import weakref
+from collections import OrderedDict
+from itertools import count
+from PIL import Image, ImageEnhance, ImageSequence
+from render_cache import Render_cache
+from render_stats import Render_stats
+from mapped_image import Mapped_image
+from charsets import Charset_registry
+from dithering import Ditherer
+from color_renderer import Color_renderer
+from edge_detector import Edge_detector
 import exceptions
 
 class Image_wrapper:
     """A class that represents an image"""
+    # Characters used for rendering unless an image sets its own charset, ordered from dark to bright.
+    ascii_chars = Charset_registry.charsets["standard"]
+    # Set to True to convert with the original per-pixel loop.
+    legacy_conversion = False
+    # Rendered ascii-art shared by all images, see _get_ascii_art.
+    render_cache = Render_cache()
+    # Disk_cache object shared by processes and runs, consulted after render_cache (None to disable).
+    disk_cache = None
+    # Timings of every rendering stage, collected when render_stats.enabled is True.
+    render_stats = Render_stats()
+    _instance_ids = count()
+    # Set to True to only read the image header on load and decode pixels on first render.
+    lazy_loading = False
+    # Max bytes of decoded pixels kept by lazily loaded images (None means no limit).
+    memory_budget = None
+    _decoded_images = OrderedDict()  # Lazily loaded images holding pixels, least recently used first.
+    # Set to False to always render from the fully decoded image.
+    draft_decoding = True
+    # How many times larger than the target size a draft decoded image must be.
+    draft_oversampling = 2
+    # Renders with more characters than this are streamed in blocks of rows instead of cached.
+    stream_threshold = 250_000
+    stream_block_rows = 16
+    # Set to False to adjust with ImageEnhance instead of one brightness and contrast table.
+    fused_pipeline = True
+    # Sources with more pixels than this are rendered in bands of tile_band_rows source rows
+    # (without dithering, see _iter_tiled_ascii_art).
+    tiled_source_pixels = 50_000_000
+    tile_band_rows = 256
+    # Milliseconds each frame is shown if the file doesn't say.
+    default_frame_duration = 100
+
     def __init__(self, 
                  filename: str, 
                  alias: str|None, 
                  target_width: int=50, 
                  brightness: float=1.0, 
-                 contrast: float=1.0):
-        """Constructs necessary attributes of an Image_wrapper object."""
-        with Image.open(filename) as image:
-            self._image =  image.copy()  # Enable later handling of certain attributes (e.g. resizing).
+                 contrast: float=1.0,
+                 lazy: bool|None=None,
+                 header: tuple|None=None):
+        """Constructs necessary attributes of an Image_wrapper object.
+        If lazy is None the lazy_loading setting decides whether pixels
+        are decoded now or on first render. If header is a tuple (size,
+        mode, format) the file isn't opened until pixels are needed.
+        """
+        self._lazy = Image_wrapper.lazy_loading if lazy is None else lazy
+        self._read_header(filename, header)
+        self._image = None
+        self._draft = None  # Reduced scale decode of a JPEG, see _get_render_source.
+        self._decoded_stat = None  # File's _file_stat when the pixels were read, see _disk_key.
+        self._thumbnail = None  # Grayscale image at target size from a binary session.
+        self._modified = False  # True once the pixels are replaced, see the image setter.
+        self._temporary = False  # True for files removed after rendering, see _disk_key.
         self._filename = filename
         self._alias = alias
         self._target_size = self._calculate_target_height(target_width)
         self._brightness = brightness
         self._contrast = contrast
+        self._charset = Image_wrapper.ascii_chars
+        self._dither = "none"  # One of Ditherer.modes.
+        self._color = "none"  # One of Color_renderer.modes.
+        self._edges = False  # True to draw strong edges with directional glyphs.
+        self._cache_id = next(Image_wrapper._instance_ids)  # Identifies the image in the render cache.
+        if not self._lazy:
+            self._get_render_source()  # Decode the pixels needed for rendering on load.
 
     @property
     def image(self):
-        """Returns an Image object"""
+        """Returns an Image object, decoding the pixels first if needed."""
+        if self._image is None:
+            self._decode_image()
+        elif self._lazy:
+            self._mark_decoded()
         return self._image
 
+    @image.setter
+    def image(self, new_image: Image):
+        """Assumes new_image is an Image object. Replaces the image's
+        pixels, keeping the target width. The new pixels are written to
+        file on the next session save.
+        """
+        self._image = new_image
+        self._draft = None
+        self._thumbnail = None
+        self._size = new_image.size
+        self._mode = new_image.mode
+        self._modified = True
+        self._target_size = self._calculate_target_height(self._target_size[0])
+        self._invalidate_renders()
+
+    def _read_header(self, filename: str, header: tuple|None=None):
+        """Sets size, mode and format from header if it's a tuple (size,
+        mode, format), otherwise from the header of the file.
+        """
+        self._frame_count = 1  # Counted on first use for files Pillow opens, see frame_count.
+        if header:
+            self._size, self._mode, self._format = tuple(header[0]), header[1], header[2]
+        elif Mapped_image.is_mappable(filename):
+            self._size, _, self._format = Mapped_image.read_header(filename)
+            self._mode = "L"
+        else:
+            with Image.open(filename) as image:
+                # Image.open only reads the header, so size and mode are available without decoding.
+                self._size = image.size
+                self._mode = image.mode
+                self._format = image.format
+            self._frame_count = None
+
+    def reload(self):
+        """Reads the image's file again after it changed on disk, keeping
+        the target width and render settings. Unsaved changes to the pixels
+        are replaced by the file's pixels.
+        """
+        self._read_header(self._filename)
+        self._image = None
+        self._draft = None
+        self._decoded_stat = None
+        self._thumbnail = None
+        self._modified = False
+        Image_wrapper._decoded_images.pop(self._cache_id, None)
+        self._target_size = self._calculate_target_height(self._target_size[0])
+        self._invalidate_renders()
+        if not self._lazy:
+            self._get_render_source()
+
+    @property
+    def frame_count(self):
+        """Returns the number of frames (e.g. of an animated GIF or multi-page TIFF)."""
+        if self._frame_count is None:
+            # Counting frames can mean reading the whole file, so it isn't done on load.
+            with Image.open(self._filename) as image:
+                self._frame_count = getattr(image, "n_frames", 1)
+        return self._frame_count
+
+    @property
+    def header(self):
+        """Returns a tuple (size, mode, format) read from the image's file header."""
+        return (self._size, self._mode, self._format)
+
+    @property
+    def is_modified(self):
+        """Returns True if the pixels differ from the image's file."""
+        return self._modified
+
+    def mark_saved(self):
+        """Marks the pixels as written to the image's file."""
+        self._modified = False
+
     @property
     def filename(self):
         """Returns a string containing the object's filename, suffix included."""
@@ -37,7 +177,17 @@ class Image_wrapper:
     @property
     def size(self):
         """Returns a tuple containing the Image object's actual size."""
-        return self._image.size
+        return self._size
+    
+    @property
+    def mode(self):
+        """Returns a string containing the Image object's mode (e.g. 'RGB')."""
+        return self._mode
+
+    @property
+    def is_decoded(self):
+        """Returns True if the image's pixels are held in memory."""
+        return self._image is not None or self._draft is not None
     
     @property
     def target_size(self):
@@ -62,6 +212,79 @@ class Image_wrapper:
                                                 + " (Original image has "
                                                 + " brightness ratio 1.0)")
         self._brightness = new_brightness
+        self._invalidate_renders()
+
+    @property
+    def charset(self):
+        """Returns a string with the characters the image is rendered with."""
+        return self._charset
+
+    @charset.setter
+    def charset(self, new_charset: str):
+        """Assumes new_charset is a string with the name of a registered
+        ramp or the characters of a ramp ordered from dark to bright.
+        Renders the image with that ramp from now on.
+        """
+        try:
+            self._charset = Charset_registry.resolve(new_charset)
+        except ValueError:
+            raise exceptions.InvalidInputError("-- Invalid charset: charset must"
+                                               + " be a ramp name ("
+                                               + ", ".join(Charset_registry.charsets)
+                                               + ") or 2 to 256 characters --")
+        self._invalidate_renders()
+
+    @property
+    def dither(self):
+        """Returns a string with the image's dithering mode."""
+        return self._dither
+
+    @dither.setter
+    def dither(self, new_dither: str):
+        """Assumes new_dither is a string with one of Ditherer.modes.
+        Renders the image with that dithering from now on.
+        """
+        new_dither = new_dither.lower()
+        if new_dither not in Ditherer.modes:
+            raise exceptions.InvalidInputError("-- Invalid dither: dither must"
+                                               + " be one of "
+                                               + ", ".join(Ditherer.modes) + " --")
+        self._dither = new_dither
+        self._invalidate_renders()
+
+    @property
+    def color(self):
+        """Returns a string with the image's color mode."""
+        return self._color
+
+    @color.setter
+    def color(self, new_color: str):
+        """Assumes new_color is a string with one of Color_renderer.modes.
+        Renders the image with ANSI colors from now on unless it's 'none'.
+        """
+        new_color = new_color.lower()
+        if new_color not in Color_renderer.modes:
+            raise exceptions.InvalidInputError("-- Invalid color: color must"
+                                               + " be one of "
+                                               + ", ".join(Color_renderer.modes) + " --")
+        self._color = new_color
+        self._invalidate_renders()
+
+    @property
+    def edges(self):
+        """Returns True if strong edges are drawn with directional glyphs."""
+        return self._edges
+
+    @edges.setter
+    def edges(self, new_edges: bool):
+        """Assumes new_edges is a bool. Turns edge-aware rendering on or off."""
+        self._edges = new_edges
+        self._invalidate_renders()
+
+    @property
+    def _ascii_table(self):
+        """Returns the 256 entry table for the image's charset, see Charset_registry.get_table."""
+        return Charset_registry.get_table(self._charset)
 
     @property
     def contrast(self):
@@ -81,6 +304,7 @@ class Image_wrapper:
                                                 + " (Original image has "
                                                 + " contrast ratio 1.0)")
         self._contrast = new_contrast
+        self._invalidate_renders()
 
     def set_target_width(self, new_width: str):
         """Assumes new_width is a string and sets the _target_size
@@ -92,6 +316,7 @@ class Image_wrapper:
             raise ValueError()
         new_target_size = self._calculate_target_height(new_width)
         self._target_size = new_target_size
+        self._invalidate_renders()
 
     def set_target_height(self, new_height: str):
         """Assumes new_height is a string and sets the _target_size
@@ -103,14 +328,45 @@ class Image_wrapper:
             raise ValueError()
         new_target_size = self._calculate_target_width(new_height)
         self._target_size = new_target_size
+        self._invalidate_renders()
     
+    def apply_settings(self, settings: dict):
+        """Assumes settings is a dict of setting names (width, height,
+        brightness, contrast, charset, dither, color and edges) to values,
+        as strings or as the property's type. Sets every setting given, other
+        keys are ignored. Raises InvalidInputError for invalid values.
+        """
+        for name, set_target in (("width", self.set_target_width),
+                                 ("height", self.set_target_height)):
+            if name in settings:
+                try:
+                    set_target(settings[name])
+                except ValueError:
+                    # Catch exception to throw a more descriptive one.
+                    raise exceptions.InvalidInputError(f"{name} must be a positive integer")
+        if "brightness" in settings:
+            self.brightness = settings["brightness"]
+        if "contrast" in settings:
+            self.contrast = settings["contrast"]
+        if "charset" in settings:
+            self.charset = settings["charset"]
+        if "dither" in settings:
+            self.dither = settings["dither"]
+        if "color" in settings:
+            self.color = settings["color"]
+        if "edges" in settings:
+            edges = settings["edges"]
+            if isinstance(edges, str):
+                edges = edges.lower() in ("on", "true", "1")
+            self.edges = edges
+
     def _calculate_target_height(self, target_width: int):
         '''Assumes target_width is a positive int. Calculates
         correct target height based on aspect ratio and target
         width input. Original target width is 50 pixels. Returns
         a tuple containing the final target size (width, height).
         '''
-        image_width, image_height = self._image.size
+        image_width, image_height = self._size
         aspect_ratio = image_height/image_width
         target_height = int(aspect_ratio * target_width * 0.55)
         if target_height < 1:
@@ -123,30 +379,608 @@ class Image_wrapper:
         height input. Returns a tuple containing the final 
         target size (width, height).
         '''
-        image_width, image_height = self._image.size
+        image_width, image_height = self._size
         aspect_ratio = image_height/image_width
         target_width = int(target_height / (aspect_ratio * 0.55))
         if target_width < 1:
             target_width = 1
         return (target_width, target_height)
 
+    def release_pixels(self):
+        """Drops the decoded pixels of a lazily loaded image. They are
+        decoded again from file on the next render.
+        """
+        if not self._lazy or self._modified:
+            return  # Pixels can't be decoded again from file.
+        self._image = None
+        self._draft = None
+        self._decoded_stat = None
+        Image_wrapper._decoded_images.pop(self._cache_id, None)
+
+    def _decode_image(self):
+        """Decodes the image's pixels from file and releases pixels of
+        other lazily loaded images if memory_budget is exceeded.
+        """
+        with Image_wrapper.render_stats.measure(self._filename, "decode"):
+            self._decoded_stat = self._file_stat()  # Before reading, a later change must show.
+            if self._format in Mapped_image.formats:
+                self._image = Mapped_image.open(self._filename)  # Maps the file instead of decoding it.
+            else:
+                with Image.open(self._filename) as image:
+                    self._image = image.copy()
+        self._draft = None  # The full image is at least as good.
+        if self._lazy:
+            self._mark_decoded()
+            self._enforce_memory_budget()
+
+    def _get_render_source(self) -> Image:
+        """Returns the smallest decoded image that covers the target
+        size with draft_oversampling margin. JPEGs are decoded at a
+        reduced scale with Image.draft, other formats and targets that
+        need full resolution use the fully decoded image.
+        """
+        if self._thumbnail is not None and self._thumbnail.size == self._target_size:
+            return self._thumbnail  # Already reduced, see set_thumbnail.
+        if self._image is not None:
+            return self.image  # Already fully decoded, no need to decode again.
+        target_width, target_height = self._target_size
+        needed_size = (target_width * Image_wrapper.draft_oversampling,
+                       target_height * Image_wrapper.draft_oversampling)
+        if (not Image_wrapper.draft_decoding or self._format != "JPEG"
+                or needed_size[0] * 2 > self._size[0]
+                or needed_size[1] * 2 > self._size[1]):
+            # Draft can at best halve the size, so a draft wouldn't help.
+            return self.image
+        if (self._draft is None or self._draft.width < needed_size[0]
+                or self._draft.height < needed_size[1]):
+            self._decode_draft(needed_size)
+        elif self._lazy:
+            self._mark_decoded()
+        return self._draft
+
+    def make_thumbnail(self) -> Image:
+        """Returns an Image object of the image at target size, before
+        brightness and contrast are applied. It's grayscale unless the
+        image is rendered in color.
+        """
+        if self._color != "none":
+            return self._resize_render_source().convert(mode="RGB")
+        return self._resize_render_source().convert(mode="L")
+
+    def set_thumbnail(self, thumbnail: Image, target_size: tuple):
+        """Assumes thumbnail is a grayscale or RGB Image object and
+        target_size is a tuple (width, height) of the same size. Sets the target size and
+        renders from thumbnail instead of the image's file as long as the
+        target size is unchanged.
+        """
+        self._target_size = tuple(target_size)
+        self._thumbnail = thumbnail
+        self._invalidate_renders()
+
+    def _decode_draft(self, needed_size: tuple):
+        """Assumes needed_size is a tuple (width, height). Decodes the
+        JPEG at the smallest scale that is at least needed_size.
+        """
+        with Image_wrapper.render_stats.measure(self._filename, "decode"):
+            self._decoded_stat = self._file_stat()  # Before reading, a later change must show.
+            with Image.open(self._filename) as image:
+                image.draft(image.mode, needed_size)  # Lets the decoder skip detail by scaling in the DCT.
+                self._draft = image.copy()
+        if self._lazy:
+            self._mark_decoded()
+            self._enforce_memory_budget()
+
+    def _file_stat(self) -> tuple|None:
+        """Returns a tuple (modification time, size, inode) of the image's
+        file, which changes when the file is written or replaced, or None
+        if the file doesn't exist.
+        """
+        try:
+            file_stat = os.stat(self._filename)
+        except FileNotFoundError:
+            return None
+        return (file_stat.st_mtime_ns, file_stat.st_size, file_stat.st_ino)
+
+    def _mark_decoded(self):
+        """Marks the image as the most recently used decoded image."""
+        decoded_images = Image_wrapper._decoded_images
+        decoded_images[self._cache_id] = weakref.ref(self)
+        decoded_images.move_to_end(self._cache_id)
+
+    def _pixel_bytes(self) -> int:
+        """Returns the number of bytes used by the decoded pixels."""
+        pixel_bytes = 0
+        for image in (self._image, self._draft):
+            if image is not None and not image.readonly:  # Mapped pixels live in the page cache.
+                pixel_bytes += image.width * image.height * len(image.getbands())
+        return pixel_bytes
+
+    @staticmethod
+    def _enforce_memory_budget():
+        """Releases the least recently used decoded pixels until the
+        lazily loaded images fit within memory_budget. The most recently
+        used image is always kept.
+        """
+        if Image_wrapper.memory_budget is None:
+            return
+        decoded_images = Image_wrapper._decoded_images
+        for cache_id, image_ref in list(decoded_images.items()):
+            if image_ref() is None:
+                del decoded_images[cache_id]  # Image_wrapper is no longer in use.
+        used_bytes = sum(image_ref()._pixel_bytes() for image_ref in decoded_images.values())
+        for image_ref in list(decoded_images.values())[:-1]:
+            if used_bytes <= Image_wrapper.memory_budget:
+                break
+            image_wrapper = image_ref()
+            if image_wrapper._modified:
+                continue  # Pixels can't be decoded again from file.
+            used_bytes -= image_wrapper._pixel_bytes()
+            image_wrapper.release_pixels()
+
+    def render_ascii_art_to_preview(self, live_preview):
+        """Assumes live_preview is a Live_preview object. Renders image as
+        ascii-art to the console, redrawing only what changed since the
+        last preview.
+        """
+        ascii_art = self._get_ascii_art()
+        with Image_wrapper.render_stats.measure(self._filename, "write"):
+            written_text = live_preview.draw(ascii_art)
+        Image_wrapper.render_stats.add_text_written(self._filename, written_text)
+
+    def play_frames(self, fps: float|None=None):
+        """Assumes fps is None or a positive float. Renders every frame as
+        ascii-art to the console, redrawing in place, at fps frames per
+        second or at the frame durations stored in the file. Frames are
+        converted one at a time while playing. Ctrl+C stops playback.
+        """
+        print("\x1b[2J", end="")  # Clear the screen once, frames are drawn from the top left.
+        next_frame_time = time.monotonic()
+        try:
+            for ascii_art, duration in self._iter_frames():
+                print("\x1b[H" + ascii_art, flush=True)
+                next_frame_time += 1 / fps if fps else duration / 1000
+                time.sleep(max(0, next_frame_time - time.monotonic()))
+        except KeyboardInterrupt:
+            print()
+
+    def render_frames_to_directory(self, directory: str) -> int:
+        """Assumes directory is a string. Renders every frame as ascii-art
+        to txt-files named frame_0001.txt and onwards in
+        ./ascii_images/directory/. Returns the number of frames written.
+        """
+        frame_number = 0
+        for frame_number, (ascii_art, _) in enumerate(self._iter_frames(), start=1):
+            frame_filename = os.path.join(directory, f"frame_{frame_number:04}.txt")
+            with self._make_directory_and_open_w(frame_filename) as text_file:
+                print(ascii_art, file=text_file)
+        return frame_number
+
+    def _iter_frames(self):
+        """Yields a tuple (ascii-art, duration in milliseconds) for every
+        frame. Frames are decoded as they are reached and a frame equal
+        to the previous one reuses its ascii-art instead of converting.
+        """
+        previous_bytes, ascii_art = None, None
+        with Image.open(self._filename) as image:
+            for frame in ImageSequence.Iterator(image):
+                duration = frame.info.get("duration") or Image_wrapper.default_frame_duration
+                with Image_wrapper.render_stats.measure(self._filename, "decode"):
+                    frame_image = frame.convert(mode="RGB")
+                    frame_bytes = frame_image.tobytes()
+                if frame_bytes != previous_bytes:
+                    ascii_art = self._convert_source_to_ascii_art(frame_image)
+                    previous_bytes = frame_bytes
+                yield ascii_art, duration
+
     def render_ascii_art_to_file(self, to_filename: str):
         """Assumes to_filename is a string. Renders image as
-        ascii-art to txt-file named after the value in to_filename.
+        ascii-art to txt-file named after the value in to_filename,
+        or to a colored html page if to_filename ends with '.html'.
         """
-        ascii_art = self._convert_to_ascii_art()
+        render_stats = Image_wrapper.render_stats
+        if to_filename.lower().endswith(".html"):
+            colored_ascii_art = "".join(self._iter_ascii_art("html"))[:-1]  # Without the last newline.
+            page = Color_renderer.html_document(colored_ascii_art, self._filename)
+            with self._make_directory_and_open_w(to_filename) as html_file:
+                with render_stats.measure(self._filename, "write"):
+                    html_file.write(page)
+            render_stats.add_text_written(self._filename, page)
+            return
         with self._make_directory_and_open_w(to_filename + ".txt") as text_file:
-            print(ascii_art, file=text_file)
+            for ascii_block in self._iter_ascii_art():
+                with render_stats.measure(self._filename, "write"):
+                    text_file.write(ascii_block)
+                render_stats.add_text_written(self._filename, ascii_block)
 
     def render_ascii_art_to_console(self):
         """Renders image as ascii-art to display in console/terminal."""
-        ascii_art = self._convert_to_ascii_art()
-        print(ascii_art)
+        render_stats = Image_wrapper.render_stats
+        for ascii_block in self._iter_ascii_art():
+            with render_stats.measure(self._filename, "write"):
+                print(ascii_block, end="", flush=True)
+            render_stats.add_text_written(self._filename, ascii_block)
+
+    def _iter_ascii_art(self, color: str|None=None):
+        """Assumes color is None or a color mode ('html' included), None
+        meaning the image's color. Yields the image's ascii-art as strings
+        of complete lines, each line ending with a newline. Uncolored
+        renders larger than stream_threshold are converted and yielded
+        stream_block_rows lines at a time. The image is still resized and
+        toned at target size as a whole first, since the contrast mean needs
+        every pixel and resizing in bands doesn't match a whole resize
+        exactly, so only the characters are produced block by block.
+        """
+        color = color or self._color
+        width, height = self._target_size
+        if self._uses_tiles():
+            yield from self._iter_tiled_ascii_art(color)
+            return
+        if (width * height <= Image_wrapper.stream_threshold or color != "none"
+                or self._edges):
+            yield self._get_ascii_art(color) + "\n"
+            return
+        grayscale_image, ascii_table = self._prepare_grayscale_image()
+        for top in range(0, height, Image_wrapper.stream_block_rows):
+            bottom = min(top + Image_wrapper.stream_block_rows, height)
+            with Image_wrapper.render_stats.measure(self._filename, "char_mapping"):
+                ascii_block = self._convert_rows_to_ascii_art(grayscale_image, ascii_table,
+                                                              top, bottom)
+            yield ascii_block + "\n"
+
+    def _uses_tiles(self) -> bool:
+        """Returns True if the source is large enough to render in bands."""
+        width, height = self._size
+        return (Image_wrapper.tiled_source_pixels is not None
+                and width * height > Image_wrapper.tiled_source_pixels)
+
+    def _iter_tiled_ascii_art(self, color: str|None=None):
+        """Assumes color is None or a color mode, see _iter_ascii_art.
+        Yields the image's ascii-art band by band, each band being the
+        lines made from tile_band_rows rows of the source. Only one band
+        of the source is copied and resized at a time, so memory-mapped
+        sources are never read into memory as a whole. The contrast mean
+        is estimated from a sparse sample of the source. Bands aren't
+        dithered, as the diffused error would restart at every band and
+        show as seams. For edges a band is resized with one more row above
+        and below, so that edges across band borders are found.
+        """
+        color = color or self._color
+        render_stats = Image_wrapper.render_stats
+        render_source = self._get_render_source()
+        source_width, source_height = render_source.size
+        target_width, target_height = self._target_size
+        scale = source_height / target_height  # Source rows per output row.
+        with render_stats.measure(self._filename, "brightness_contrast"):
+            sample = render_source.resize((min(source_width, 256), min(source_height, 256)),
+                                          Image.Resampling.NEAREST)  # Only reads the sampled rows.
+            if sample.mode not in ("L", "RGB"):
+                sample = sample.convert(mode="RGB")
+            tone_table = self._build_tone_table(sample)
+        rows_per_band = max(1, int(Image_wrapper.tile_band_rows / scale))
+        margin = math.ceil(2 * max(scale, 1)) + 1  # Rows the bicubic filter reaches past a band.
+        for top in range(0, target_height, rows_per_band):
+            bottom = min(top + rows_per_band, target_height)
+            overlap_top, overlap_bottom = top, bottom
+            if self._edges:
+                overlap_top, overlap_bottom = max(0, top - 1), min(target_height, bottom + 1)
+            band_top, band_bottom = overlap_top * scale, overlap_bottom * scale
+            crop_top = max(0, int(band_top) - margin)
+            crop_bottom = min(source_height, math.ceil(band_bottom) + margin)
+            with render_stats.measure(self._filename, "resize"):
+                band = render_source.crop((0, crop_top, source_width, crop_bottom))
+                if band.mode not in ("L", "RGB"):
+                    band = band.convert(mode="RGB")  # Before resizing, see _resize_render_source.
+                overlap_band = band.resize((target_width, overlap_bottom - overlap_top),
+                                           box=(0, band_top - crop_top,
+                                                source_width, band_bottom - crop_top))
+                resized_band = overlap_band
+                if self._edges:
+                    resized_band = overlap_band.crop((0, top - overlap_top,
+                                                      target_width, bottom - overlap_top))
+            grayscale_band, ascii_table = self._apply_tone_table(resized_band, tone_table,
+                                                                 dither="none")
+            with render_stats.measure(self._filename, "char_mapping"):
+                ascii_block = self._translate_to_ascii_art(grayscale_band.tobytes(),
+                                                           target_width, ascii_table)
+            if self._edges:
+                ascii_block = self._overlay_edges(ascii_block, overlap_band, tone_table,
+                                                  top=top - overlap_top)
+            if color != "none":
+                ascii_block = self._colorize(ascii_block, resized_band, tone_table, color)
+            yield ascii_block + "\n"
 
-    def _convert_to_ascii_art(self) -> str:
-        """Converts pixels to ascii-characters and returns a string containing ascii-art."""
+    def _get_ascii_art(self, color: str|None=None) -> str:
+        """Assumes color is None or a color mode, see _iter_ascii_art.
+        Returns the image's ascii-art, from the render cache if the
+        image was rendered with the same settings before.
+        """
+        ascii_art = self._load_cached_ascii_art(color)
+        if ascii_art is None:
+            ascii_art = self._convert_to_ascii_art(color)
+            self._store_ascii_art(ascii_art, color)
+        return ascii_art
+
+    def _load_cached_ascii_art(self, color: str|None=None) -> str|None:
+        """Assumes color is None or a color mode, see _iter_ascii_art.
+        Returns the image's ascii-art from the render cache, or from the
+        disk cache (keeping it in the render cache too), or None if neither
+        has it.
+        """
+        key = self._render_key(color)
+        ascii_art = Image_wrapper.render_cache.get(key)
+        if ascii_art is None:
+            disk_key = self._disk_key(color)
+            if disk_key:
+                with Image_wrapper.render_stats.measure(self._filename, "disk_cache"):
+                    ascii_art = Image_wrapper.disk_cache.get(disk_key)
+            if ascii_art is not None:
+                Image_wrapper.render_cache.put(key, ascii_art)
+        return ascii_art
+
+    def _store_ascii_art(self, ascii_art: str, color: str|None=None,
+                         source_stat: tuple|None=None):
+        """Assumes ascii_art is the image's current render with color (None
+        or a color mode) and source_stat is None or the _file_stat of the
+        file when it was read for the render, see _disk_key. Stores it in
+        the render cache and disk cache.
+        """
+        Image_wrapper.render_cache.put(self._render_key(color), ascii_art)
+        disk_key = self._disk_key(color, source_stat)
+        if disk_key:
+            with Image_wrapper.render_stats.measure(self._filename, "disk_cache"):
+                Image_wrapper.disk_cache.put(disk_key, ascii_art)
+
+    def _disk_key(self, color: str|None=None, source_stat: tuple|None=None) -> str|None:
+        """Assumes source_stat is None or the _file_stat of the file when
+        it was read, by default when the pixels were decoded. Returns the
+        key of the image's current render in the disk cache, or None if
+        there is no disk cache, the render doesn't come from the file alone
+        (replaced pixels or a session thumbnail) or the file has changed
+        since it was read, as the file's digest wouldn't match the pixels.
+        Legacy conversion renders aren't cached, they ignore color and edges.
+        """
+        disk_cache = Image_wrapper.disk_cache
+        if (disk_cache is None or Image_wrapper.legacy_conversion
+                or self._modified or self._thumbnail is not None):
+            return None
+        file_stat = self._file_stat()
+        source_stat = source_stat or self._decoded_stat
+        if file_stat is None or (source_stat is not None and source_stat != file_stat):
+            return None
+        # Every class setting that changes the output, as another run may use other values.
+        settings = self._render_key(color)[1:] + (Image_wrapper.fused_pipeline,
+                                                  Image_wrapper.draft_decoding,
+                                                  Image_wrapper.draft_oversampling,
+                                                  Image_wrapper.tiled_source_pixels,
+                                                  Image_wrapper.tile_band_rows,
+                                                  Color_renderer.color_step,
+                                                  Edge_detector.threshold,
+                                                  Edge_detector.glyphs)
+        source_digest = disk_cache.source_digest(self._filename, persist=not self._temporary)
+        return disk_cache.make_key(source_digest, settings)
+
+    def _render_key(self, color: str|None=None) -> tuple:
+        """Returns a tuple identifying the image's current render in the render cache."""
+        return (self._cache_id, self._target_size, self._brightness,
+                self._contrast, self._charset, self._dither, color or self._color,
+                self._edges)
+
+    def _renders_from_memory(self) -> bool:
+        """Returns True if the image renders from pixels that aren't in its
+        file, a session thumbnail or replaced pixels, so that another
+        process can't render it from _render_job.
+        """
+        return self._modified or self._thumbnail is not None
+
+    def _render_job(self) -> tuple:
+        """Returns a small picklable tuple describing the image's current
+        render, used to render the image in another process.
+        """
+        return (self._filename, self._target_size, self._brightness, self._contrast,
+                self._charset, self._dither, self._color, self._edges)
+
+    @staticmethod
+    def _render_job_to_ascii_art(render_job: tuple) -> str:
+        """Assumes render_job is a tuple from _render_job. Decodes the
+        image from file and returns its ascii-art.
+        """
+        (filename, target_size, brightness, contrast,
+         charset, dither, color, edges) = render_job
+        image_wrapper = Image_wrapper(filename, None, target_size[0],
+                                      brightness, contrast, lazy=True)
+        image_wrapper._charset = charset
+        image_wrapper._dither = dither
+        image_wrapper._color = color
+        image_wrapper._edges = edges
+        image_wrapper._target_size = target_size  # Keep a target size that was set from height.
+        return image_wrapper._convert_to_ascii_art()
+
+    def _invalidate_renders(self):
+        """Removes the image's renders from the render cache."""
+        Image_wrapper.render_cache.invalidate(self._cache_id)
+
+    def _convert_to_ascii_art(self, color: str|None=None) -> str:
+        """Assumes color is None or a color mode, see _iter_ascii_art.
+        Converts pixels to ascii-characters and returns a string containing ascii-art.
+        Uses the legacy per-pixel loop (without color) if legacy_conversion is set.
+        """
+        if Image_wrapper.legacy_conversion:
+            return self._convert_to_ascii_art_legacy()
+        if self._uses_tiles():
+            return "".join(self._iter_tiled_ascii_art(color))[:-1]  # Without the last newline.
+        return self._convert_source_to_ascii_art(color=color)
+
+    def _convert_source_to_ascii_art(self, render_source: Image.Image|None=None,
+                                     color: str|None=None) -> str:
+        """Assumes render_source is None or an Image object, such as a
+        frame, and color is None or a color mode, see _iter_ascii_art.
+        Converts render_source, or the image itself if None, to
+        ascii-art and returns it as a string.
+        """
+        color = color or self._color
+        if color == "none" and not self._edges:
+            grayscale_image, ascii_table = self._prepare_grayscale_image(render_source)
+            with Image_wrapper.render_stats.measure(self._filename, "char_mapping"):
+                return self._translate_to_ascii_art(grayscale_image.tobytes(),
+                                                    grayscale_image.width, ascii_table)
+        # Edges and colors need the resized image as well, so the steps are taken here.
+        resized_image = self._resize_render_source(render_source)
+        tone_table = self._build_tone_table(resized_image)
+        grayscale_image, ascii_table = self._apply_tone_table(resized_image, tone_table)
+        with Image_wrapper.render_stats.measure(self._filename, "char_mapping"):
+            ascii_art = self._translate_to_ascii_art(grayscale_image.tobytes(),
+                                                     grayscale_image.width, ascii_table)
+        if self._edges:
+            ascii_art = self._overlay_edges(ascii_art, resized_image, tone_table, grayscale_image)
+        if color == "none":
+            return ascii_art
+        return self._colorize(ascii_art, resized_image, tone_table, color)
+
+    def _overlay_edges(self, ascii_art: str, resized_image: Image.Image,
+                       tone_table: list, grayscale_image: Image.Image|None=None,
+                       top: int=0) -> str:
+        """Assumes ascii_art is a string made from resized_image (its rows
+        from top on), tone_table is a list from _build_tone_table and
+        grayscale_image is None or the image from _apply_tone_table.
+        Returns ascii_art with strong edges of resized_image drawn with
+        directional glyphs.
+        """
+        with Image_wrapper.render_stats.measure(self._filename, "edges"):
+            if grayscale_image is None or resized_image.mode == "L" or self._dither != "none":
+                # grayscale_image is untoned (folded table) or dithered, edges need the toned image.
+                grayscale_image = resized_image.convert(mode="L").point(tone_table)
+            return Edge_detector.overlay(ascii_art, grayscale_image, top)
+
+    def _colorize(self, ascii_art: str, resized_image: Image.Image,
+                  tone_table: list, color: str) -> str:
+        """Assumes ascii_art is a string made from resized_image, tone_table
+        is a list from _build_tone_table and color is a color mode. Returns
+        ascii_art colored with resized_image's colors after brightness and contrast.
+        """
+        with Image_wrapper.render_stats.measure(self._filename, "color"):
+            color_image = resized_image.point(tone_table * len(resized_image.getbands()))
+            return Color_renderer.colorize(ascii_art, color_image, color)
+
+    def _prepare_grayscale_image(self, render_source: Image.Image|None=None) -> tuple:
+        """Assumes render_source is None or an Image object to render
+        instead of the image itself. Returns a tuple with a grayscale Image
+        object of target size and the table that maps its bytes to
+        ascii-characters. With fused_pipeline the resized image gets
+        brightness and contrast from one table (Image.point) before
+        conversion to grayscale, and for grayscale sources the table is
+        folded into the character table unless the image is dithered.
+        """
+        if not Image_wrapper.fused_pipeline:
+            return self._adjust_image_for_render(render_source), self._ascii_table
+        return self._apply_tone_table(self._resize_render_source(render_source))
+
+    def _resize_render_source(self, render_source: Image.Image|None=None) -> Image.Image:
+        """Assumes render_source is None or an Image object to render
+        instead of the image itself. Returns it resized to target size in
+        mode 'L' or 'RGB'. Other modes are converted before resizing, since
+        Pillow resizes palette images with nearest neighbour sampling.
+        """
+        if render_source is None:
+            render_source = self._get_render_source()
+        with Image_wrapper.render_stats.measure(self._filename, "resize"):
+            if render_source.mode not in ("L", "RGB"):
+                render_source = render_source.convert(mode="RGB")
+            return render_source.resize(self._target_size)
+
+    def _apply_tone_table(self, resized_image: Image, tone_table: list|None=None,
+                          dither: str|None=None) -> tuple:
+        """Assumes resized_image is an Image object in mode 'L' or 'RGB',
+        tone_table is None or a list from _build_tone_table and dither is
+        None (the image's dither mode) or a dither mode. Applies tone_table,
+        built from resized_image if None, and returns a tuple with the
+        grayscale Image object and the table that maps its bytes to
+        ascii-characters.
+        """
+        render_stats = Image_wrapper.render_stats
+        with render_stats.measure(self._filename, "brightness_contrast"):
+            if tone_table is None:
+                tone_table = self._build_tone_table(resized_image)
+            if resized_image.mode == "L" and (dither or self._dither) == "none":
+                ascii_table = self._ascii_table
+                folded_table = [ascii_table[tone] for tone in tone_table]
+                if isinstance(ascii_table, str):
+                    return resized_image, "".join(folded_table)
+                return resized_image, bytes(folded_table)
+            if tone_table != list(range(256)):
+                # Same table for every band.
+                resized_image = resized_image.point(tone_table * len(resized_image.getbands()))
+        with render_stats.measure(self._filename, "grayscale"):
+            grayscale_image = resized_image.convert(mode="L")
+        return self._dither_image(grayscale_image, dither), self._ascii_table
+
+    def _dither_image(self, grayscale_image: Image.Image, dither: str|None=None) -> Image.Image:
+        """Assumes grayscale_image is a grayscale Image object and dither is
+        None (the image's dither mode) or a dither mode. Returns it dithered
+        to the tones of the image's charset if dithering is set.
+        """
+        dither = dither or self._dither
+        if dither == "none":
+            return grayscale_image
+        with Image_wrapper.render_stats.measure(self._filename, "dither"):
+            return Ditherer.dither(grayscale_image, dither, len(self._charset))
+
+    def _build_tone_table(self, resized_image: Image) -> list:
+        """Assumes resized_image is an Image object in mode 'L' or 'RGB'.
+        Returns a 256 entry list mapping every band value to its value
+        after brightness and contrast, matching ImageEnhance. The contrast
+        mean is taken from the image's histogram instead of an enhanced copy.
+        """
+        brightened = [min(255, int(value * self._brightness)) for value in range(256)]
+        histogram = resized_image.histogram()
+        pixel_count = resized_image.width * resized_image.height
+        band_means = [sum(count * brightened[value]
+                          for value, count in enumerate(histogram[start:start + 256])) / pixel_count
+                      for start in range(0, len(histogram), 256)]
+        if len(band_means) == 3:
+            # Same weights as convert(mode="L").
+            mean = (band_means[0] * 299 + band_means[1] * 587 + band_means[2] * 114) / 1000
+        else:
+            mean = band_means[0]
+        mean = int(mean + 0.5)
+        return [min(255, max(0, int(mean + self._contrast * (tone - mean))))
+                for tone in brightened]
+
+    @staticmethod
+    def _convert_rows_to_ascii_art(grayscale_image: Image, ascii_table: bytes|str,
+                                   top: int, bottom: int) -> str:
+        """Assumes grayscale_image is a grayscale Image object, ascii_table
+        is a table from Charset_registry.get_table and top and bottom are ints. Converts the rows
+        from top up to bottom to ascii-characters and returns them as lines
+        of ascii-art.
+        """
+        rows = grayscale_image.crop((0, top, grayscale_image.width, bottom))
+        return Image_wrapper._translate_to_ascii_art(rows.tobytes(), rows.width, ascii_table)
+
+    @staticmethod
+    def _translate_to_ascii_art(grayscale_bytes: bytes, width: int,
+                                ascii_table: bytes|str) -> str:
+        """Assumes grayscale_bytes is bytes of grayscale rows, width is the
+        row length and ascii_table is a table from Charset_registry.get_table.
+        Maps every byte to its character in one pass and returns the rows
+        joined as lines of ascii-art.
+        """
+        if isinstance(ascii_table, str):
+            # Non-ascii ramps (e.g. block glyphs) translate as text, latin-1 keeps every byte's value.
+            text = grayscale_bytes.decode("latin-1").translate(ascii_table)
+            return "\n".join(text[start:start + width]
+                             for start in range(0, len(text), width))
+        ascii_bytes = grayscale_bytes.translate(ascii_table)
+        lines = [ascii_bytes[start:start + width]
+                 for start in range(0, len(ascii_bytes), width)]
+        return b"\n".join(lines).decode("ascii")
+
+    def _convert_to_ascii_art_legacy(self) -> str:
+        """Converts pixels to ascii-characters one pixel at a time and
+        returns a string containing ascii-art. Kept for comparison with
+        the translate based conversion.
+        """
         ascii_art = ""
-        ascii_chars = " `.-:+=*#%@"
+        ascii_chars = self._charset
         adjusted_image = self._adjust_image_for_render()
         width, height = adjusted_image.size
         # convert each pixel to ascii-character and add to the ascii-art-string.
@@ -154,26 +988,34 @@ class Image_wrapper:
             for x in range(width):
                 pos = (x, y)  # x and y together form coordinates for the image's pixels.
                 grayscale = adjusted_image.getpixel(pos)
-                ascii_char = ascii_chars[grayscale //
-                                        (256 // (len(ascii_chars) -1))]  # Map pixel's brightness to the indices of the chars.
+                ascii_char = ascii_chars[Charset_registry.ramp_index(
+                    grayscale, len(ascii_chars))]  # Map pixel's brightness to the indices of the chars.
                 ascii_art += ascii_char
             if y < height - 1:
                 # Insert new line in the end of each complete line except for the last line.
                 ascii_art += "\n"
         return ascii_art
 
-    def _adjust_image_for_render(self) -> Image:
-        """Assumes image is an Image object. Resizes original
+    def _adjust_image_for_render(self, render_source: Image.Image|None=None) -> Image:
+        """Assumes render_source is None or an Image object to use instead
+        of the original image. Resizes original
         image, Fetches enhanced copies of the image object
         (enhanced brightness and contrast), converts it's mode
         to grayscale. Returns Image object that is fully
         adjusted and ready for conversion to ascii-art.
         """
-        resized_image = self._image.resize(self._target_size)  # Enables access to a resized copy of the original image.
-        enhanced_image = self._enhance_image_brightness(resized_image)
-        fully_enhanced_image = self._enhance_image_contrast(enhanced_image)
-        grayscale_image = fully_enhanced_image.convert(mode="L")  # Enables access to pixel's brightness
-        return grayscale_image
+        render_stats = Image_wrapper.render_stats
+        if render_source is None:
+            render_source = self._get_render_source()
+        with render_stats.measure(self._filename, "resize"):
+            resized_image = render_source.resize(self._target_size)  # Enables access to a resized copy of the original image.
+        with render_stats.measure(self._filename, "brightness"):
+            enhanced_image = self._enhance_image_brightness(resized_image)
+        with render_stats.measure(self._filename, "contrast"):
+            fully_enhanced_image = self._enhance_image_contrast(enhanced_image)
+        with render_stats.measure(self._filename, "grayscale"):
+            grayscale_image = fully_enhanced_image.convert(mode="L")  # Enables access to pixel's brightness
+        return self._dither_image(grayscale_image)
     
     def _enhance_image_brightness(self, image: Image):
         """Assumes image is an Image object. Adjusts the image
@@ -198,4 +1040,4 @@ class Image_wrapper:
         """
         path = "./ascii_images/" + filename
         os.makedirs(os.path.dirname(path), exist_ok=True)
-        return open(path, "w")
\ No newline at end of file
+        return open(path, "w", encoding="utf-8")  # Charsets may hold non-ascii glyphs.
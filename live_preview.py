@@ -0,0 +1,74 @@
+import re
+import sys
+
+class Live_preview:
+    """A class that keeps the last ascii-art drawn at the top of the
+    terminal and redraws only the cells that changed, using ANSI cursor
+    positioning.
+    """
+    # Unchanged cells shorter than this between two changes are rewritten
+    # instead of starting a new cursor move (which costs about as much).
+    min_gap = 8
+    _color_code = re.compile(r"\x1b\[[0-9;]*m")
+
+    def __init__(self, stream=None):
+        """Constructs an objects necessary attributes."""
+        self._stream = stream or sys.stdout
+        self._lines = None
+        self._width = None  # Visible width of the last frame's lines.
+
+    def reset(self):
+        """Forgets the last frame so that the next draw redraws everything."""
+        self._lines = None
+
+    def draw(self, ascii_art: str) -> str:
+        """Assumes ascii_art is a string. Draws it at the top left of the
+        terminal, only writing the cells that differ from the last frame
+        if it had the same size. Leaves the cursor on the line below.
+        Returns the text written.
+        """
+        lines = ascii_art.split("\n")
+        width = self._visible_width(lines[0])
+        if self._lines is None or len(lines) != len(self._lines) or width != self._width:
+            output = ["\x1b[H\x1b[2J", ascii_art]  # Clear the screen and draw everything.
+        else:
+            output = []
+            for row, (line, last_line) in enumerate(zip(lines, self._lines), start=1):
+                if line != last_line and ("\x1b" in line or "\x1b" in last_line):
+                    # Offsets in colored lines aren't columns, so the line is rewritten whole.
+                    output.append(f"\x1b[{row};1H{line}\x1b[K")
+                elif line != last_line:
+                    for start, end in self._changed_spans(line, last_line):
+                        output.append(f"\x1b[{row};{start + 1}H{line[start:end]}")
+        output.append(f"\x1b[{len(lines) + 1};1H\x1b[J")  # Below the frame, clear the rest.
+        self._lines = lines
+        self._width = width
+        text = "".join(output)
+        self._stream.write(text)
+        self._stream.flush()
+        return text
+
+    @staticmethod
+    def _visible_width(line: str) -> int:
+        """Returns the number of characters of line shown in the terminal,
+        color codes excluded.
+        """
+        if "\x1b" in line:
+            return len(Live_preview._color_code.sub("", line))
+        return len(line)
+
+    @staticmethod
+    def _changed_spans(line: str, last_line: str) -> list:
+        """Assumes line and last_line are strings of equal length. Returns
+        a list of (start, end) tuples covering every changed cell, merging
+        changes separated by fewer than min_gap unchanged cells.
+        """
+        spans = []
+        for column, (char, last_char) in enumerate(zip(line, last_line)):
+            if char == last_char:
+                continue
+            if spans and column - spans[-1][1] < Live_preview.min_gap:
+                spans[-1][1] = column + 1
+            else:
+                spans.append([column, column + 1])
+        return spans
@@ -1,34 +1,137 @@
+import argparse
+import os.path
+import sys
 from command_handler import Command_handler
+from render_server import Render_server
+from image_wrapper import Image_wrapper
+from disk_cache import Disk_cache
 import exceptions
 
 def main():
-    """The main body of the program."""
+    """The main body of the program. Runs commands from a script file
+    or the command line if given, otherwise starts the interactive prompt.
+    """
+    arguments = parse_arguments()
+    if not arguments.no_cache:
+        Image_wrapper.disk_cache = Disk_cache(arguments.cache_dir)
+    if arguments.serve is not None:
+        run_server(arguments.host, arguments.serve, arguments.workers)
+        return
+    if arguments.script or arguments.commands:
+        sys.exit(run_batch(arguments.script, arguments.commands,
+                           arguments.stop_on_error))
+    run_interactive()
+
+def parse_arguments():
+    """Returns the parsed command line arguments."""
+    parser = argparse.ArgumentParser(description="ASCII Art Studio")
+    parser.add_argument("script", nargs="?",
+                        help="file with one command per line ('-' reads stdin)")
+    parser.add_argument("-c", "--command", dest="commands", action="append",
+                        default=[], help="command to run, can be repeated")
+    parser.add_argument("--stop-on-error", action="store_true",
+                        help="stop at the first command that fails")
+    parser.add_argument("--cache-dir", default=os.path.expanduser("~/.cache/ascii_art_studio"),
+                        help="directory of the render cache kept between runs")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="don't keep renders between runs")
+    parser.add_argument("--serve", type=int, metavar="PORT",
+                        help="serve renders over HTTP on PORT instead")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="address to serve on (default: 127.0.0.1)")
+    parser.add_argument("--workers", type=int,
+                        help="number of render worker processes (default: one per core)")
+    return parser.parse_args()
+
+def run_server(host: str, port: int, workers: int|None):
+    """Assumes host is a string, port is an int and workers is None or an
+    int. Serves renders of images in the current directory until interrupted.
+    """
+    Render_server.max_workers = workers
+    render_server = Render_server(host, port)
+    host, port = render_server.address
+    print(f"Serving ASCII art on http://{host}:{port}/render (Ctrl+C to stop)")
+    try:
+        render_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+def run_interactive():
+    """Reads and executes commands until the user quits the program."""
     print("Welcome to ASCII Art Studio!", "(Enter \'help\' for commands)",
           "Enter command below:", sep="\n")
     # exits loop when user quit program.
     while True:
         command = input("AAS: ")
+        run_command(command, sys.stdout)
+
+def run_batch(script: str|None, commands: list, stop_on_error: bool) -> int:
+    """Assumes script is None or a filename ('-' for stdin), commands is a
+    list of strings and stop_on_error is a bool. Executes the commands
+    from script followed by commands, without banner or prompt. Errors
+    are written to stderr. Returns the exit code: 0 if every command
+    succeeded, 1 if any failed and 2 if script couldn't be read.
+    """
+    Command_handler.quiet_exit = True
+    lines = []
+    if script == "-":
+        lines = sys.stdin.read().splitlines()
+    elif script:
+        try:
+            with open(script) as script_file:
+                lines = script_file.read().splitlines()
+        except OSError as e:
+            print(f"-- Script not readable: '{script}' ({e.strerror}) --", file=sys.stderr)
+            return 2
+    labeled_commands = ([(f"line {number}", line) for number, line in enumerate(lines, start=1)]
+                        + [(f"command {number}", command)
+                           for number, command in enumerate(commands, start=1)])
+    exit_code = 0
+    for label, command in labeled_commands:
+        command = command.strip()
+        if not command or command.startswith("#"):
+            # Skip blank lines and comments.
+            continue
         try:
-            Command_handler.execute_command(command)
-        except exceptions.InvalidCommandInputError as e:
-            print(e)
-        except exceptions.EmptyImageCollectionError as e:
-            print(e)
-        except FileNotFoundError:
-            print("-- File not found: The filename you entered could"
-                  + " not be found --")
-        except exceptions.ImageNotFoundError as e:
-            print(e)
-        except FileExistsError:
-            print("-- Invalid filename: The file you entered already"
-                  + " exist --")
-        except exceptions.InvalidInputError as e:
-            print(e)
-        except exceptions.SessionLoadError as e:
-            print(e)
-        except Exception as e:
-            print(f"-- An unexcpected error occured: {e} --")
+            succeeded = run_command(command, sys.stderr, f"{label}: ")
+        except SystemExit:
+            # 'quit' ends the batch, keeping the exit code of earlier commands.
+            break
+        if not succeeded:
+            exit_code = 1
+            if stop_on_error:
+                break
+    return exit_code
+
+def run_command(command: str, error_stream, error_prefix: str="") -> bool:
+    """Assumes command is a string and error_stream is a writable stream.
+    Executes command and writes a message to error_stream if it fails.
+    Returns True if the command succeeded.
+    """
+    try:
+        Command_handler.execute_command(command)
+        return True
+    except exceptions.InvalidCommandInputError as e:
+        message = str(e)
+    except exceptions.EmptyImageCollectionError as e:
+        message = str(e)
+    except FileNotFoundError:
+        message = ("-- File not found: The filename you entered could"
+                   + " not be found --")
+    except exceptions.ImageNotFoundError as e:
+        message = str(e)
+    except FileExistsError:
+        message = ("-- Invalid filename: The file you entered already"
+                   + " exist --")
+    except exceptions.InvalidInputError as e:
+        message = str(e)
+    except exceptions.SessionLoadError as e:
+        message = str(e)
+    except Exception as e:
+        message = f"-- An unexcpected error occured: {e} --"
+    print(error_prefix + message, file=error_stream)
+    return False
 
 # Start the main program
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,75 @@
+import os.path
+import re
+import numpy
+from PIL import Image
+import exceptions
+
+class Mapped_image:
+    """A class that opens 8-bit grayscale PGM (P5) and raw files as Image
+    objects viewing a memory-mapped copy of the file instead of decoded
+    pixels. Raw files carry their size in the filename, e.g.
+    'frame_1920x1080.raw'.
+    """
+    formats = ("PGM", "RAW")
+    _raw_size_pattern = re.compile(r'_(\d+)x(\d+)\.raw$', re.IGNORECASE)
+    _pgm_token_pattern = re.compile(rb'(?:\s|#[^\n]*\n)*(\S+)')
+
+    @staticmethod
+    def is_mappable(filename: str) -> bool:
+        """Assumes filename is a string. Returns True if filename has a
+        suffix that is opened by memory-mapping.
+        """
+        return os.path.splitext(filename)[1].lower() in (".pgm", ".raw")
+
+    @staticmethod
+    def read_header(filename: str) -> tuple:
+        """Assumes filename is a string naming a PGM or raw file. Returns
+        a tuple (size, offset, format) where offset is the position of the
+        first pixel. Raises InvalidInputError if the file can't be mapped.
+        """
+        if filename.lower().endswith(".raw"):
+            match = Mapped_image._raw_size_pattern.search(filename)
+            if not match:
+                raise exceptions.InvalidInputError(f"-- Load failed: '{filename}' must be"
+                                                   + " named like 'name_WIDTHxHEIGHT.raw' --")
+            size = (int(match.group(1)), int(match.group(2)))
+            Mapped_image._check_file_size(filename, size, 0)
+            return size, 0, "RAW"
+
+        with open(filename, "rb") as pgm_file:
+            header = pgm_file.read(1024)
+        tokens, position = [], 0
+        for _ in range(4):  # Magic number, width, height and max value.
+            match = Mapped_image._pgm_token_pattern.match(header, position)
+            if not match:
+                break
+            tokens.append(match.group(1))
+            position = match.end()
+        if (len(tokens) < 4 or tokens[0] != b"P5" or not all(token.isdigit() for token in tokens[1:])
+                or int(tokens[3]) > 255):
+            raise exceptions.InvalidInputError(f"-- Load failed: '{filename}' is not an"
+                                               + " 8-bit binary PGM (P5) --")
+        size = (int(tokens[1]), int(tokens[2]))
+        offset = position + 1  # A single whitespace character ends the header.
+        Mapped_image._check_file_size(filename, size, offset)
+        return size, offset, "PGM"
+
+    @staticmethod
+    def _check_file_size(filename: str, size: tuple, offset: int):
+        """Raises InvalidInputError if the file is too short for size."""
+        width, height = size
+        if os.path.getsize(filename) < offset + width * height:
+            raise exceptions.InvalidInputError(f"-- Load failed: '{filename}' is shorter"
+                                               + f" than {width}x{height} pixels --")
+
+    @staticmethod
+    def open(filename: str) -> Image:
+        """Assumes filename is a string naming a PGM or raw file. Returns
+        a read-only grayscale Image object sharing the memory-mapped
+        file's pages, so nothing is decoded or copied.
+        """
+        size, offset, _ = Mapped_image.read_header(filename)
+        width, height = size
+        pixels = numpy.memmap(filename, dtype=numpy.uint8, mode="r",
+                              offset=offset, shape=(height, width))
+        return Image.frombuffer("L", size, pixels, "raw", "L", 0, 1)
@@ -0,0 +1,70 @@
+from collections import OrderedDict
+
+class Render_cache:
+    """A class representing a bounded cache of rendered ascii-art,
+    evicting the least recently used render when full.
+    """
+    def __init__(self, max_entries: int=32):
+        """Constructs an objects necessary attributes."""
+        self._renders = OrderedDict()
+        self._max_entries = max_entries
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def hits(self):
+        """Returns the number of lookups that found a cached render."""
+        return self._hits
+
+    @property
+    def misses(self):
+        """Returns the number of lookups that found no cached render."""
+        return self._misses
+
+    @property
+    def max_entries(self):
+        """Returns the maximum number of cached renders."""
+        return self._max_entries
+
+    def __len__(self):
+        return len(self._renders)
+
+    def get(self, key: tuple) -> str|None:
+        """Assumes key is a tuple. Returns the cached ascii-art for key
+        or None if it isn't cached.
+        """
+        ascii_art = self._renders.get(key)
+        if ascii_art is None:
+            self._misses += 1
+            return None
+        self._renders.move_to_end(key)  # Mark as most recently used.
+        self._hits += 1
+        return ascii_art
+
+    def put(self, key: tuple, ascii_art: str):
+        """Assumes key is a tuple and ascii_art is a string. Caches
+        ascii_art and evicts the least recently used render if the
+        cache is full.
+        """
+        self._renders[key] = ascii_art
+        self._renders.move_to_end(key)
+        while len(self._renders) > self._max_entries:
+            self._renders.popitem(last=False)
+
+    def invalidate(self, owner_id: int):
+        """Assumes owner_id is an int. Removes every cached render
+        whose key starts with owner_id.
+        """
+        for key in [key for key in self._renders if key[0] == owner_id]:
+            del self._renders[key]
+
+    def reset_counters(self):
+        """Resets the hit and miss counters, keeping the cached renders."""
+        self._hits = 0
+        self._misses = 0
+
+    def clear(self):
+        """Removes every cached render and resets the counters."""
+        self._renders.clear()
+        self._hits = 0
+        self._misses = 0
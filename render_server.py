@@ -0,0 +1,283 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from PIL import Image
+from image_wrapper import Image_wrapper
+from render_cache import Render_cache
+from color_renderer import Color_renderer
+import exceptions
+
+class Render_server:
+    """A class that serves ascii-art renders over HTTP. Renders run on a
+    pool of worker processes started with the server, and finished
+    renders are kept in a render cache shared by every request.
+
+    GET or POST /render?path=... renders an image below root, and a POST
+    with the image file as body renders the upload. Both take the query
+    parameters width, height, brightness, contrast, charset, dither,
+    color, edges (on/off) and format (text/html). GET /metrics returns
+    counters and latency percentiles as json and GET /health returns 'ok'.
+    """
+    # Number of worker processes (None means one per core).
+    max_workers = None
+    # Requests rendering or waiting for a worker at once, more are answered with 503.
+    max_pending = 32
+    # Seconds a rejected client is asked to wait before retrying.
+    retry_after = 1
+    # Largest accepted upload in bytes.
+    max_upload_bytes = 20_000_000
+    # Number of most recent request latencies the percentiles in /metrics are taken from.
+    latency_window = 1000
+    render_parameters = ("width", "height", "brightness", "contrast", "charset",
+                         "dither", "color", "edges", "format")
+
+    def __init__(self, host: str="127.0.0.1", port: int=8000, root: str="."):
+        """Constructs an objects necessary attributes. Assumes host is a
+        string, port is an int (0 picks a free port) and root is the
+        directory that images given by path must be in.
+        """
+        self._root = os.path.realpath(root)
+        self._render_cache = Render_cache(max_entries=256)
+        self._pending = threading.BoundedSemaphore(Render_server.max_pending)
+        self._lock = threading.Lock()  # Guards the cache, counters and latencies.
+        self._counts = {"requests": 0, "rendered": 0, "cached": 0,
+                        "rejected": 0, "failed": 0}
+        self._in_flight = 0
+        self._latencies = deque(maxlen=Render_server.latency_window)
+        self._workers = Render_server.max_workers or os.cpu_count() or 1
+        self._executor = None
+        self._http_server = ThreadingHTTPServer((host, port), Render_request_handler)
+        self._http_server.daemon_threads = True
+        self._http_server.render_server = self
+
+    @property
+    def address(self) -> tuple:
+        """Returns a tuple (host, port) the server listens on."""
+        return self._http_server.server_address[:2]
+
+    def start_workers(self):
+        """Starts the worker processes, so that the first requests don't
+        wait for processes to start and import the pipeline.
+        """
+        if self._executor:
+            return
+        self._executor = ProcessPoolExecutor(max_workers=self._workers)
+        warm_ups = [self._executor.submit(os.getpid) for _ in range(self._workers)]
+        for warm_up in warm_ups:
+            warm_up.result()
+
+    def serve_forever(self):
+        """Starts the workers and handles requests until shutdown is called."""
+        self.start_workers()
+        try:
+            self._http_server.serve_forever()
+        finally:
+            self.close()
+
+    def shutdown(self):
+        """Stops serve_forever, called from another thread."""
+        self._http_server.shutdown()
+
+    def close(self):
+        """Closes the listening socket and stops the worker processes."""
+        self._http_server.server_close()
+        if self._executor:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def try_acquire(self) -> bool:
+        """Returns True and takes a pending slot if one is free, otherwise
+        counts the request as rejected and returns False.
+        """
+        if self._pending.acquire(blocking=False):
+            with self._lock:
+                self._in_flight += 1
+            return True
+        with self._lock:
+            self._counts["requests"] += 1
+            self._counts["rejected"] += 1
+        return False
+
+    def release(self, latency: float, outcome: str):
+        """Assumes latency is in seconds and outcome is 'rendered', 'cached'
+        or 'failed'. Frees the pending slot and records the request.
+        """
+        with self._lock:
+            self._in_flight -= 1
+            self._counts["requests"] += 1
+            self._counts[outcome] += 1
+            self._latencies.append(latency)
+        self._pending.release()
+
+    def render(self, query: dict, upload: bytes|None) -> tuple:
+        """Assumes query is a dict from parse_qs and upload is None or the
+        bytes of an image file. Returns a tuple (ascii-art, cached) with the
+        render of the upload or of the image at query's path. Raises
+        PermissionError for paths outside root, FileNotFoundError if path
+        isn't a file and InvalidInputError if neither is given.
+        """
+        parameters = {name: values[-1] for name, values in query.items()
+                      if name in Render_server.render_parameters}
+        if upload is not None:
+            source_key = ("upload", hashlib.sha256(upload).hexdigest())
+        elif "path" not in query:
+            raise exceptions.InvalidInputError("a path or an uploaded image is required")
+        else:
+            filename = self._resolve_path(query["path"][-1])
+            if not os.path.isfile(filename):
+                raise FileNotFoundError(query["path"][-1])
+            file_stat = os.stat(filename)
+            source_key = (filename, file_stat.st_mtime_ns, file_stat.st_size)
+        key = (source_key, tuple(sorted(parameters.items())))
+        with self._lock:
+            ascii_art = self._render_cache.get(key)
+        if ascii_art is not None:
+            return ascii_art, True
+        if upload is None:
+            ascii_art = self._executor.submit(Render_server._render_job,
+                                              (filename, parameters, False)).result()
+        else:
+            with tempfile.NamedTemporaryFile(suffix=".upload", delete=False) as upload_file:
+                upload_file.write(upload)
+            try:
+                ascii_art = self._executor.submit(Render_server._render_job,
+                                                  (upload_file.name, parameters, True)).result()
+            finally:
+                os.remove(upload_file.name)
+        with self._lock:
+            self._render_cache.put(key, ascii_art)
+        return ascii_art, False
+
+    def _resolve_path(self, path: str) -> str:
+        """Assumes path is a string. Returns its real path, raising
+        PermissionError if it isn't below root.
+        """
+        filename = os.path.realpath(os.path.join(self._root, path))
+        if os.path.commonpath([self._root, filename]) != self._root:
+            raise PermissionError(path)
+        return filename
+
+    @staticmethod
+    def _render_job(render_job: tuple) -> str:
+        """Assumes render_job is a tuple (filename, parameters, is_upload).
+        Runs in a worker process. Renders the image with the parameters set
+        through Image_wrapper, so invalid values raise the same errors as
+        commands. Uploads are temporary files, their digests aren't kept.
+        """
+        filename, parameters, is_upload = render_job
+        image_wrapper = Image_wrapper(filename, None, lazy=True)
+        image_wrapper._temporary = is_upload
+        image_wrapper.apply_settings(parameters)
+        if parameters.get("format", "text") == "html":
+            colored_ascii_art = "".join(image_wrapper._iter_ascii_art("html"))[:-1]
+            return Color_renderer.html_document(colored_ascii_art, os.path.basename(filename))
+        return "".join(image_wrapper._iter_ascii_art())
+
+    def metrics(self) -> dict:
+        """Returns a dict with request counters, requests in flight and
+        latency percentiles in milliseconds over the latest requests.
+        """
+        with self._lock:
+            metrics = dict(self._counts)
+            metrics["in_flight"] = self._in_flight
+            latencies = sorted(self._latencies)
+            metrics["cache_entries"] = len(self._render_cache)
+        metrics["max_pending"] = Render_server.max_pending
+        metrics["workers"] = self._workers
+        metrics["latency_ms"] = {
+            name: round(latencies[min(len(latencies) - 1, int(len(latencies) * share))] * 1000, 3)
+                  if latencies else None
+            for name, share in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("max", 1.0))
+        }
+        return metrics
+
+
+class Render_request_handler(BaseHTTPRequestHandler):
+    """A class that handles the HTTP requests of a Render_server."""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        """Handles GET requests."""
+        self._handle_request(None)
+
+    def do_POST(self):
+        """Handles POST requests, the body being an uploaded image if any."""
+        content_length = int(self.headers.get("Content-Length", 0))
+        if content_length > Render_server.max_upload_bytes:
+            self.close_connection = True  # The body is left unread.
+            self._send(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "-- Upload too large --\n")
+            return
+        self._handle_request(content_length)
+
+    def _handle_request(self, content_length: int|None):
+        """Assumes content_length is None or the length of the request
+        body. Routes the request to metrics, health or a render.
+        """
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        render_server = self.server.render_server
+        if url.path == "/metrics":
+            self._send(HTTPStatus.OK, json.dumps(render_server.metrics(), indent=4),
+                       "application/json")
+        elif url.path == "/health":
+            self._send(HTTPStatus.OK, "ok\n")
+        elif url.path == "/render":
+            self._handle_render(render_server, query, content_length)
+        else:
+            self._send(HTTPStatus.NOT_FOUND, "-- Not found --\n")
+
+    def _handle_render(self, render_server: Render_server, query: dict,
+                       content_length: int|None):
+        """Renders the requested image if a pending slot is free, otherwise
+        answers 503 so that the load balancer can retry elsewhere.
+        """
+        start = time.perf_counter()
+        if not render_server.try_acquire():
+            self.close_connection = True
+            self._send(HTTPStatus.SERVICE_UNAVAILABLE, "-- Server busy, retry later --\n",
+                       headers={"Retry-After": str(Render_server.retry_after)})
+            return
+        outcome = "failed"
+        try:
+            upload = self.rfile.read(content_length) if content_length else None
+            try:
+                ascii_art, cached = render_server.render(query, upload)
+                outcome = "cached" if cached else "rendered"
+                status = HTTPStatus.OK
+            except PermissionError:
+                status, ascii_art = HTTPStatus.FORBIDDEN, "-- Path outside the served directory --\n"
+            except FileNotFoundError:
+                status, ascii_art = HTTPStatus.NOT_FOUND, "-- File not found --\n"
+            except (exceptions.InvalidInputError, ValueError, Image.UnidentifiedImageError) as e:
+                status, ascii_art = HTTPStatus.BAD_REQUEST, f"-- Invalid request: {e} --\n"
+            except Exception as e:
+                status, ascii_art = HTTPStatus.INTERNAL_SERVER_ERROR, f"-- Render failed: {e} --\n"
+        finally:
+            latency = time.perf_counter() - start
+            render_server.release(latency, outcome)
+        content_type = "text/plain"
+        if status == HTTPStatus.OK and query.get("format", ["text"])[-1] == "html":
+            content_type = "text/html"
+        self._send(status, ascii_art, content_type,
+                   {"X-Render-Time-Ms": f"{latency * 1000:.3f}",
+                    "X-Render-Cache": "hit" if outcome == "cached" else "miss"})
+
+    def _send(self, status: HTTPStatus, text: str, content_type: str="text/plain",
+              headers: dict|None=None):
+        """Sends a response with text as utf-8 body."""
+        body = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
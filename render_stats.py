@@ -0,0 +1,117 @@
+import json
+import time
+from contextlib import contextmanager, nullcontext
+
+class Render_stats:
+    """A class that collects timings of each rendering stage and the
+    number of bytes written, per image. Collects nothing unless enabled.
+    """
+    _disabled_measure = nullcontext()  # Shared, so disabled measuring allocates nothing.
+
+    def __init__(self):
+        """Constructs an objects necessary attributes."""
+        self.enabled = False
+        self._timings = {}  # image name -> stage -> [calls, seconds]
+        self._bytes_written = {}  # image name -> bytes
+
+    def measure(self, image_name: str, stage: str):
+        """Assumes image_name and stage are strings. Returns a context
+        manager that adds the time spent inside it to stage of image_name.
+        """
+        if not self.enabled:
+            return Render_stats._disabled_measure
+        return self._measure(image_name, stage)
+
+    @contextmanager
+    def _measure(self, image_name: str, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stage_timing = self._timings.setdefault(image_name, {}).setdefault(stage, [0, 0.0])
+            stage_timing[0] += 1
+            stage_timing[1] += time.perf_counter() - start
+
+    def add_bytes_written(self, image_name: str, byte_count: int):
+        """Assumes image_name is a string and byte_count is an int.
+        Adds byte_count to the bytes written for image_name.
+        """
+        if self.enabled:
+            self._bytes_written[image_name] = self._bytes_written.get(image_name, 0) + byte_count
+
+    def add_text_written(self, image_name: str, text: str):
+        """Assumes image_name and text are strings. Adds the length of text
+        encoded as utf-8 to the bytes written for image_name. Nothing is
+        encoded unless enabled.
+        """
+        if self.enabled:
+            self.add_bytes_written(image_name, len(text.encode("utf-8")))
+
+    def reset(self):
+        """Removes all collected timings and byte counts."""
+        self._timings.clear()
+        self._bytes_written.clear()
+
+    def to_dict(self, render_cache) -> dict:
+        """Assumes render_cache is a Render_cache object. Returns a dict
+        with cumulative and per image timings (in seconds), bytes written
+        and the render cache's counters.
+        """
+        total = {}
+        for stage_timings in self._timings.values():
+            for stage, (calls, seconds) in stage_timings.items():
+                total_timing = total.setdefault(stage, {"calls": 0, "seconds": 0.0})
+                total_timing["calls"] += calls
+                total_timing["seconds"] += seconds
+        images = {}
+        for image_name in sorted(self._timings.keys() | self._bytes_written.keys()):
+            images[image_name] = {
+                "stages": {stage: {"calls": calls, "seconds": seconds}
+                           for stage, (calls, seconds) in self._timings.get(image_name, {}).items()},
+                "bytes_written": self._bytes_written.get(image_name, 0)
+            }
+        lookups = render_cache.hits + render_cache.misses
+        return {
+            "enabled": self.enabled,
+            "total": {"stages": total, "bytes_written": sum(self._bytes_written.values())},
+            "images": images,
+            "render_cache": {
+                "hits": render_cache.hits,
+                "misses": render_cache.misses,
+                "hit_rate": render_cache.hits / lookups if lookups else 0.0
+            }
+        }
+
+    def display(self, render_cache):
+        """Assumes render_cache is a Render_cache object. Outputs the
+        collected timings, bytes written and render cache hit rate.
+        """
+        stats = self.to_dict(render_cache)
+        print("=== Render stats ===")
+        if not self.enabled:
+            print("(Collection is off, enter 'stats on' to collect timings)")
+        print("Total:")
+        Render_stats._display_timings(stats["total"])
+        for image_name, image_stats in stats["images"].items():
+            print(image_name)
+            Render_stats._display_timings(image_stats)
+        cache_stats = stats["render_cache"]
+        print(f"Render cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses"
+              + f" ({cache_stats['hit_rate']:.1%} hit rate)")
+
+    @staticmethod
+    def _display_timings(stats: dict):
+        """Assumes stats is a dict with 'stages' and 'bytes_written'.
+        Outputs one line per stage and the bytes written.
+        """
+        for stage, timing in stats["stages"].items():
+            print(f"{stage + ': ':>21}{timing['calls']} calls, "
+                  + f"{timing['seconds'] * 1000:.2f} ms")
+        print(f"{'bytes written: ':>21}{stats['bytes_written']}")
+
+    def export(self, render_cache, filename: str):
+        """Assumes render_cache is a Render_cache object and filename is
+        a string. Writes the collected stats as json to filename.
+        """
+        with open(filename, "w") as json_file:
+            json.dump(self.to_dict(render_cache), json_file, indent=4)
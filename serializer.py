@@ -1,46 +1,185 @@
 import json
+import mmap
+import os
+import struct
+import tempfile
+import zlib
+from PIL import Image
 from image_collection import Image_collection
 from image_wrapper import Image_wrapper
+import exceptions
 
 class Serializer:
+    # Sessions saved with this suffix use the binary format, others are json.
+    binary_suffix = ".aas"
+    # Set to True to zlib-compress thumbnails in binary sessions (they can't be memory-mapped then).
+    compress_thumbnails = False
+    # A binary session starts with _binary_magic and the length of its json
+    # metadata (unsigned 64 bit little-endian), followed by the metadata and
+    # the thumbnails it points to (grayscale, or RGB for colored images).
+    _binary_magic = b"AASSESS1"
+    _binary_header = struct.Struct("<8sQ")
+
     @staticmethod
     def serialize(image_collection: Image_collection, filename: str):
         """Assumes image_collection is an Image_collection object and filename is
         a string. Checks if current session has any loaded images. If it contain
         loaded images, transform current session's data to json format. Renders
-        transformed session data to specified json-file.
+        transformed session data to specified json-file, or to a binary session
+        with thumbnails if filename ends with binary_suffix. The file is
+        written to a temporary file first and then linked into place, so it
+        never exists half written. Raises FileExistsError if it already exists.
         """
         image_collection.check_empty_image_collection()
+        if os.path.exists(filename):
+            raise FileExistsError(filename)
         data = Serializer._transform_data_to_json_format(image_collection)
-        with open(filename, "x") as json_file:
-            json.dump(data, json_file, indent=4)
+        if filename.endswith(Serializer.binary_suffix):
+            Serializer._write_atomically(
+                filename, "wb",
+                lambda session_file: Serializer._write_binary_session(session_file,
+                                                                      image_collection,
+                                                                      data))
+        else:
+            Serializer._write_atomically(
+                filename, "w",
+                lambda json_file: json.dump(data, json_file, indent=4))
+
+    @staticmethod
+    def _write_atomically(filename: str, mode: str, write_session):
+        """Assumes filename and mode are strings and write_session is a
+        callable taking an open file. Lets write_session write to a
+        temporary file and links it to filename once complete.
+        """
+        directory = os.path.dirname(os.path.abspath(filename))
+        with tempfile.NamedTemporaryFile(mode, dir=directory, suffix=".tmp",
+                                         delete=False) as session_file:
+            write_session(session_file)
+            session_file.flush()
+            os.fsync(session_file.fileno())
+        try:
+            os.link(session_file.name, filename)  # Fails instead of overwriting an existing file.
+        finally:
+            os.remove(session_file.name)
+
+    @staticmethod
+    def _write_binary_session(session_file, image_collection: Image_collection,
+                              session_data: dict):
+        """Assumes session_file is a file open for binary writing,
+        image_collection is an Image_collection object and session_data is
+        its data from _transform_data_to_json_format. Writes the metadata
+        and a thumbnail at target size for every image, in RGB if the
+        image is rendered in color.
+        """
+        thumbnails, offset = [], 0
+        for image_wrapper, image_data in zip(image_collection.images, session_data["images"]):
+            thumbnail = image_wrapper.make_thumbnail()
+            thumbnail_bytes = thumbnail.tobytes()
+            compression = "none"
+            if Serializer.compress_thumbnails:
+                thumbnail_bytes = zlib.compress(thumbnail_bytes)
+                compression = "zlib"
+            image_data["header"] = image_wrapper.header
+            image_data["thumbnail"] = {"offset": offset, "length": len(thumbnail_bytes),
+                                       "compression": compression, "mode": thumbnail.mode}
+            thumbnails.append(thumbnail_bytes)
+            offset += len(thumbnail_bytes)
+        metadata = json.dumps(session_data).encode("utf-8")
+        session_file.write(Serializer._binary_header.pack(Serializer._binary_magic,
+                                                          len(metadata)))
+        session_file.write(metadata)
+        for thumbnail_bytes in thumbnails:
+            session_file.write(thumbnail_bytes)
 
     @staticmethod
-    def deserialize(filename: str):
-        """Assumes filename is a string that include file suffix '.json'.
-        Instanciates an Image_collection object. Fetches data from the 
-        specified json-file and instanciates new Image_wrapper objects 
-        based on fetched data. Returns Image_collection object 
-        containing loaded images from the saved session.
+    def deserialize(filename: str, failures: list|None=None):
+        """Assumes filename is a string that include file suffix '.json'
+        and failures is None or a list. Instanciates an Image_collection
+        object. Fetches data from the specified json-file and instanciates
+        new Image_wrapper objects based on fetched data, opening the images
+        concurrently. If failures is a list, images that fail to open are
+        appended to it as (filename, error) tuples and skipped, otherwise
+        the first error is raised. Returns Image_collection object
+        containing loaded images from the saved session. Filenames ending
+        with binary_suffix are loaded as binary sessions.
         """
+        if filename.endswith(Serializer.binary_suffix):
+            return Serializer._deserialize_binary(filename)
         image_collection = Image_collection()
         with open(filename, "r") as json_file:
             session_data = json.load(json_file)
 
-            # Instanciate Image_wrapper objects based on the number of saved images and their individual data
-            for image in session_data["images"]:
-                image_collection._check_filename_existance(image["filename"])  # Validate loaded filename.
-                image_collection._validate_alias(image["alias"])  # Validate loaded alias.
-                target_size = image["target_size"]
-                target_width = target_size[0]  # Fetch only the width of saved target size.
-                image_wrapper = Image_wrapper(image["filename"], image["alias"],
-                                              target_width, image["brightness"],
-                                              image["contrast"])
-                image_collection.add_image_to_collection(image_wrapper)  # Add image_wrapper instance to list of images.
+        arguments_list = []
+        for image in session_data["images"]:
+            target_size = image["target_size"]
+            target_width = target_size[0]  # Fetch only the width of saved target size.
+            arguments_list.append((image["filename"], image["alias"], target_width,
+                                   image["brightness"], image["contrast"]))
+
+        # Instanciate Image_wrapper objects based on the number of saved images and their individual data
+        image_wrappers = Image_collection.create_image_wrappers(arguments_list)
+        current_image_data = session_data["current_image"]
+        for image, image_wrapper in zip(session_data["images"], image_wrappers):
+            image_collection._check_filename_existance(image["filename"])  # Validate loaded filename.
+            image_collection._validate_alias(image["alias"])  # Validate loaded alias.
+            if isinstance(image_wrapper, Exception):
+                if failures is None:
+                    raise image_wrapper
+                failures.append((image["filename"], image_wrapper))
+                continue
+            image_wrapper.apply_settings(image)  # Older sessions lack the newer settings.
+            image_collection.add_image_to_collection(image_wrapper)  # Add image_wrapper instance to list of images.
+            if image["filename"] == current_image_data["filename"]:
+                image_collection.current_image = image_wrapper
+
+        if image_collection.current_image is None and image_collection.images:
+            # The current image failed to load.
+            image_collection.current_image = image_collection.images[-1]
+        return image_collection
+
+    @staticmethod
+    def _deserialize_binary(filename: str):
+        """Assumes filename is a string containing a path to a binary
+        session. Memory-maps the file and instanciates Image_wrapper
+        objects that render from the stored thumbnails without opening
+        the original images. Returns an Image_collection object.
+        """
+        image_collection = Image_collection()
+        with open(filename, "rb") as session_file:
+            try:
+                session_map = mmap.mmap(session_file.fileno(), 0, access=mmap.ACCESS_READ)
+                magic, metadata_length = Serializer._binary_header.unpack_from(session_map)
+            except (ValueError, struct.error):
+                magic = None  # Empty or too short to be a binary session.
+        if magic != Serializer._binary_magic:
+            raise exceptions.SessionLoadError(f"-- Load failed: '{filename}'"
+                                              + " is not a binary session --")
+        data_start = Serializer._binary_header.size + metadata_length
+        session_data = json.loads(session_map[Serializer._binary_header.size:data_start])
+        session_buffer = memoryview(session_map)
 
-                current_image_data = session_data["current_image"]
-                if image["filename"] == current_image_data["filename"]:
-                    image_collection.current_image = image_wrapper
+        current_image_data = session_data["current_image"]
+        for image in session_data["images"]:
+            image_collection._check_filename_existance(image["filename"])  # Validate loaded filename.
+            image_collection._validate_alias(image["alias"])  # Validate loaded alias.
+            thumbnail_data = image["thumbnail"]
+            start = data_start + thumbnail_data["offset"]
+            thumbnail_bytes = session_buffer[start:start + thumbnail_data["length"]]
+            if thumbnail_data["compression"] == "zlib":
+                thumbnail_bytes = zlib.decompress(thumbnail_bytes)
+            target_size = tuple(image["target_size"])
+            # frombuffer shares the mapped memory instead of copying it.
+            thumbnail_mode = thumbnail_data.get("mode", "L")  # Older sessions are grayscale only.
+            thumbnail = Image.frombuffer(thumbnail_mode, target_size, thumbnail_bytes,
+                                         "raw", thumbnail_mode, 0, 1)
+            image_wrapper = Image_wrapper(image["filename"], image["alias"], target_size[0],
+                                          image["brightness"], image["contrast"],
+                                          lazy=True, header=image["header"])
+            image_wrapper.apply_settings(image)
+            image_wrapper.set_thumbnail(thumbnail, target_size)
+            image_collection.add_image_to_collection(image_wrapper)
+            if image["filename"] == current_image_data["filename"]:
+                image_collection.current_image = image_wrapper
         return image_collection
 
     @staticmethod
@@ -53,7 +192,10 @@ class Serializer:
             "current_image": None
         }
         for image_wrapper in image_collection.images:
-            image_wrapper.image.save(image_wrapper.filename)  # Save image on disk (overwrites file if already exists).
+            if image_wrapper.is_modified:
+                # Only images whose pixels were replaced differ from their file.
+                image_wrapper.image.save(image_wrapper.filename)  # Save image on disk (overwrites file if already exists).
+                image_wrapper.mark_saved()
 
             image_data = {
                 "filename": image_wrapper.filename,
@@ -61,7 +203,11 @@ class Serializer:
                 "size": image_wrapper.size,
                 "target_size": image_wrapper.target_size,
                 "brightness": image_wrapper.brightness,
-                "contrast": image_wrapper.contrast
+                "contrast": image_wrapper.contrast,
+                "charset": image_wrapper.charset,
+                "dither": image_wrapper.dither,
+                "color": image_wrapper.color,
+                "edges": image_wrapper.edges
             }
             session_data["images"].append(image_data)
 
@@ -1,9 +1,18 @@
 import unittest
+import io
 import os
+import re
+import shutil
+import time
+from contextlib import redirect_stdout
+from types import SimpleNamespace
+from PIL import Image
 import exceptions
 from image_collection import Image_collection
 from image_wrapper import Image_wrapper
+from file_watcher import File_watcher
 from serializer import Serializer
+from batch_renderer import Batch_renderer
 
 class TestImageCollection(unittest.TestCase):
     def setUp(self):
@@ -11,6 +20,7 @@ class TestImageCollection(unittest.TestCase):
         # Assumes image-file "slalom.jpg" is in cwd.
         self.collection.load_image("slalom.jpg", "some alias")
         self.test_to_filename = "test_render_file"
+        self.test_to_directory = "test_render_directory"
 
     def test_initialization_and_add_method(self):
         self.assertEqual(len(self.collection.images), 1)
@@ -31,6 +41,8 @@ class TestImageCollection(unittest.TestCase):
             self.collection._validate_alias(self.collection.images[0].alias)
         with self.assertRaises(exceptions.InvalidInputError):
             self.collection._validate_alias("current")
+        with self.assertRaises(exceptions.InvalidInputError):
+            self.collection._validate_alias("All")
         self.assertIsNone(self.collection._validate_alias(None))
 
     def test_find_image_wrapper(self):
@@ -39,6 +51,28 @@ class TestImageCollection(unittest.TestCase):
         with self.assertRaises(exceptions.ImageNotFoundError):
             self.collection._find_image_wrapper("name that dont exist")
 
+    def test_load_images(self):
+        loaded_count, failures = self.collection.load_images("*.jpg")
+        self.assertEqual(loaded_count, 1)  # slalom.jpg is already loaded.
+        self.assertEqual([filename for filename, _ in failures], ["slalom.jpg"])
+        self.assertEqual(self.collection.current_image.filename, "stadshuset.jpg")
+        with self.assertRaises(exceptions.ImageNotFoundError):
+            self.collection.load_images("no_such_image_*.png")
+
+    def test_lookups_scale_to_many_images(self):
+        start = time.perf_counter()
+        for number in range(10_000):
+            filename, alias = f"image_{number}.jpg", f"alias_{number}"
+            self.collection._check_filename_existance(filename)
+            self.collection._validate_alias(alias)
+            self.collection.add_image_to_collection(SimpleNamespace(filename=filename,
+                                                                    alias=alias))
+        for number in range(10_000):
+            self.collection._find_image_wrapper(f"alias_{number}")
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertEqual(self.collection._find_image_wrapper("image_9999.jpg").alias,
+                         "alias_9999")
+
     def test_render_ascii_art_to_file(self):
         with self.assertRaises(exceptions.ImageNotFoundError):
             self.collection.render_ascii_art("name that dont exist",
@@ -49,6 +83,28 @@ class TestImageCollection(unittest.TestCase):
                                        + self.test_to_filename 
                                        + ".txt"))
     
+    def test_render_all(self):
+        self.collection.load_image("stadshuset.jpg", None)
+        Image.new("RGB", (60, 40)).save("test_broken_image.jpg")
+        self.collection.load_image("test_broken_image.jpg", None)
+        os.remove("test_broken_image.jpg")  # Workers can no longer decode it.
+        self.collection.images[1].set_target_width("70")
+        failures = self.collection.render_all(self.test_to_directory)
+        self.assertEqual([image_name for image_name, _ in failures],
+                         ["test_broken_image.jpg"])
+        for image_wrapper, name in zip(self.collection.images, ["some alias", "stadshuset"]):
+            with open(f"./ascii_images/{self.test_to_directory}/{name}.txt") as text_file:
+                self.assertEqual(text_file.read(),
+                                 image_wrapper._convert_to_ascii_art() + "\n")
+
+    def test_render_all_looks_up_each_image_once(self):
+        render_cache = Image_wrapper.render_cache
+        render_cache.clear()
+        self.collection.render_all(self.test_to_directory)
+        self.assertEqual((render_cache.hits, render_cache.misses), (0, 1))
+        self.collection.render_all(self.test_to_directory)
+        self.assertEqual((render_cache.hits, render_cache.misses), (1, 1))
+
     def test_set_image_attribute_errors(self):
         with self.assertRaises(exceptions.ImageNotFoundError):
             self.collection.set_image_attribute("name that dont exist", "width", "40")
@@ -81,10 +137,82 @@ class TestImageCollection(unittest.TestCase):
         self.assertEqual(self.collection.images[0].contrast, 1.6)
         self.assertNotEqual(self.collection.images[0].contrast, original_contrast)
 
+    def test_set_image_attribute_charset(self):
+        filename = self.collection.images[0].filename
+        self.collection.set_image_attribute(filename, "charset", "blocks_inverted")
+        self.assertEqual(self.collection.images[0].charset, "█▓▒░ ")
+        self.collection.set_image_attribute(filename, "charset", " .oO")
+        self.assertEqual(self.collection.images[0].charset, " .oO")
+        with self.assertRaises(exceptions.InvalidInputError):
+            self.collection.set_image_attribute(filename, "charset", "x")
+
+    def test_set_image_attribute_dither(self):
+        filename = self.collection.images[0].filename
+        self.collection.set_image_attribute(filename, "dither", "atkinson")
+        self.assertEqual(self.collection.images[0].dither, "atkinson")
+        with self.assertRaises(exceptions.InvalidInputError):
+            self.collection.set_image_attribute(filename, "dither", "random")
+
+    def test_file_watcher_debounces_changes(self):
+        Image.new("L", (40, 20), 255).save("test_watched_image.png")
+        self.addCleanup(os.remove, "test_watched_image.png")
+        file_watcher = File_watcher(["test_watched_image.png", "slalom.jpg"])
+        self.assertEqual(file_watcher.poll(now=0), [])
+        Image.new("L", (40, 20), 0).save("test_watched_image.png")
+        os.utime("test_watched_image.png", ns=(1, 1))
+        self.assertEqual(file_watcher.poll(now=1), [])  # Seen, may still be written.
+        os.utime("test_watched_image.png", ns=(2, 2))
+        self.assertEqual(file_watcher.poll(now=1 + File_watcher.debounce), [])  # Written again.
+        self.assertEqual(file_watcher.poll(now=1 + 2 * File_watcher.debounce),
+                         ["test_watched_image.png"])
+        self.assertEqual(file_watcher.poll(now=10), [])
+
+    def test_watch_renders_changed_images_only(self):
+        Image.new("L", (40, 20), 255).save("test_watched_image.png")
+        self.addCleanup(os.remove, "test_watched_image.png")
+        self.collection.load_image("test_watched_image.png", None)
+        slalom_wrapper, watched_wrapper = self.collection.images
+        watched_renders = self.collection.watch("all", self.test_to_directory)
+        self.addCleanup(watched_renders.close)
+        self.assertEqual([next(watched_renders) for _ in range(2)],
+                         [("some alias", None), ("test_watched_image.png", None)])
+        slalom_ascii_art = slalom_wrapper._get_ascii_art()
+        original_poll_interval, original_debounce = File_watcher.poll_interval, File_watcher.debounce
+        File_watcher.poll_interval, File_watcher.debounce = 0, 0
+        self.addCleanup(setattr, File_watcher, "poll_interval", original_poll_interval)
+        self.addCleanup(setattr, File_watcher, "debounce", original_debounce)
+        Image.new("L", (80, 20), 0).save("test_watched_image.png")
+        os.utime("test_watched_image.png", ns=(1, 1))
+        self.assertEqual(next(watched_renders), ("test_watched_image.png", None))
+        self.assertEqual(watched_wrapper.header[0], (80, 20))
+        with open(f"./ascii_images/{self.test_to_directory}/test_watched_image.txt") as text_file:
+            self.assertEqual(set(text_file.read()), {Image_wrapper.ascii_chars[0], "\n"})
+        self.assertIs(slalom_wrapper._get_ascii_art(), slalom_ascii_art)  # Not rendered again.
+        with open("test_watched_image.png", "wb") as broken_file:
+            broken_file.write(b"not an image")
+        watched_name, error = next(watched_renders)
+        self.assertEqual(watched_name, "test_watched_image.png")
+        self.assertIsInstance(error, Image.UnidentifiedImageError)  # Reported, still watching.
+        Image.new("L", (40, 20), 255).save("test_watched_image.png")
+        self.assertEqual(next(watched_renders), ("test_watched_image.png", None))
+
+    def test_watch_all_without_target_prints(self):
+        self.collection.load_image("stadshuset.jpg", None)
+        watched_renders = self.collection.watch("all", None)
+        self.addCleanup(watched_renders.close)
+        stdout = io.StringIO()
+        with redirect_stdout(stdout):
+            self.assertEqual([next(watched_renders) for _ in range(2)],
+                             [("some alias", None), ("stadshuset.jpg", None)])
+        self.assertIn(self.collection.images[1]._get_ascii_art(), stdout.getvalue())
+        self.assertFalse(os.path.exists("./ascii_images/some alias.txt"))
+        self.assertFalse(os.path.exists("./ascii_images/stadshuset.txt"))
+
     def tearDown(self):
         # Delete temporary files.
         if os.path.exists("./ascii_images/" + self.test_to_filename):
             os.remove("./ascii_images/" + self.test_to_filename)
+        shutil.rmtree("./ascii_images/" + self.test_to_directory, ignore_errors=True)
 
 class TestSerializer(unittest.TestCase):
     def setUp(self):
@@ -97,12 +225,108 @@ class TestSerializer(unittest.TestCase):
         Serializer.serialize(self.collection, self.test_file)
         self.assertTrue(os.path.exists(self.test_file))
 
+    def test_serialize_skips_unmodified_images(self):
+        modified_time = os.path.getmtime("slalom.jpg")
+        Serializer.serialize(self.collection, self.test_file)
+        self.assertEqual(os.path.getmtime("slalom.jpg"), modified_time)
+        self.assertIsNone(self.collection.images[0]._image)  # Never fully decoded.
+        with self.assertRaises(FileExistsError):
+            Serializer.serialize(self.collection, self.test_file)
+
+    def test_serialize_saves_modified_images(self):
+        Image.new("RGB", (60, 40)).save("test_modified_image.png")
+        try:
+            self.collection.load_image("test_modified_image.png", None)
+            image_wrapper = self.collection.current_image
+            image_wrapper.image = Image.new("RGB", (30, 20), (255, 255, 255))
+            self.assertTrue(image_wrapper.is_modified)
+            Serializer.serialize(self.collection, self.test_file)
+            self.assertFalse(image_wrapper.is_modified)
+            with Image.open("test_modified_image.png") as saved_image:
+                self.assertEqual(saved_image.size, (30, 20))
+        finally:
+            os.remove("test_modified_image.png")
+
     def test_deserialize(self):
         Serializer.serialize(self.collection, self.test_file)
         deserialized_collection = Serializer.deserialize(self.test_file)
         self.assertIsInstance(deserialized_collection, Image_collection)
         self.assertEqual(len(deserialized_collection.images), 1)
         self.assertIsInstance(deserialized_collection.images[0], Image_wrapper)
+        self.assertEqual(deserialized_collection.images[0].charset, Image_wrapper.ascii_chars)
+
+    def test_binary_session(self):
+        binary_file = "test_serialization.aas"
+        self.collection.load_image("stadshuset.jpg", "town hall")
+        self.collection.images[1].set_target_height("30")
+        try:
+            Serializer.serialize(self.collection, binary_file)
+            deserialized_collection = Serializer.deserialize(binary_file)
+            self.assertEqual(len(deserialized_collection.images), 2)
+            self.assertEqual(deserialized_collection.current_image.alias, "town hall")
+            for image_wrapper, deserialized_wrapper in zip(self.collection.images,
+                                                           deserialized_collection.images):
+                self.assertEqual(deserialized_wrapper.size, image_wrapper.size)
+                self.assertEqual(deserialized_wrapper.target_size, image_wrapper.target_size)
+                self.assertIsNone(deserialized_wrapper._image)
+                ascii_art = deserialized_wrapper._convert_to_ascii_art()
+                self.assertIsNone(deserialized_wrapper._draft)  # Rendered from the thumbnail.
+                mismatches = sum(char != other_char for char, other_char
+                                 in zip(ascii_art, image_wrapper._convert_to_ascii_art()))
+                self.assertLess(mismatches / len(ascii_art), 0.02)
+        finally:
+            if os.path.exists(binary_file):
+                os.remove(binary_file)
+        with open(binary_file, "wb") as invalid_file:
+            invalid_file.write(b"not a session")
+        try:
+            with self.assertRaises(exceptions.SessionLoadError):
+                Serializer.deserialize(binary_file)
+        finally:
+            os.remove(binary_file)
+
+    def test_binary_session_keeps_colors(self):
+        binary_file = "test_serialization.aas"
+        self.collection.images[0].color = "truecolor"
+        try:
+            Serializer.serialize(self.collection, binary_file)
+            deserialized_wrapper = Serializer.deserialize(binary_file).images[0]
+            colored_ascii_art = "".join(deserialized_wrapper._iter_ascii_art())
+        finally:
+            os.remove(binary_file)
+        colors = re.findall(r"\x1b\[38;2;(\d+);(\d+);(\d+)m", colored_ascii_art)
+        self.assertTrue(colors)
+        self.assertTrue(any(len(set(color)) > 1 for color in colors))  # Not only grays.
+
+    def test_binary_session_renders_all_without_originals(self):
+        binary_file = "test_serialization.aas"
+        shutil.copy("stadshuset.jpg", "test_session_image.jpg")
+        self.collection.load_image("test_session_image.jpg", None)
+        try:
+            Serializer.serialize(self.collection, binary_file)
+            os.remove("test_session_image.jpg")
+            deserialized_collection = Serializer.deserialize(binary_file)
+            # Workers can't see the thumbnails, so these render in-process, like 'render'.
+            self.assertEqual(Batch_renderer.render(deserialized_collection.images),
+                             [deserialized_wrapper._convert_to_ascii_art()
+                              for deserialized_wrapper in deserialized_collection.images])
+        finally:
+            for filename in (binary_file, "test_session_image.jpg"):
+                if os.path.exists(filename):
+                    os.remove(filename)
+
+    def test_deserialize_collects_failures(self):
+        Image.new("RGB", (60, 40)).save("test_missing_image.jpg")
+        self.collection.load_image("test_missing_image.jpg", "missing")
+        Serializer.serialize(self.collection, self.test_file)
+        os.remove("test_missing_image.jpg")
+        with self.assertRaises(FileNotFoundError):
+            Serializer.deserialize(self.test_file)
+        failures = []
+        deserialized_collection = Serializer.deserialize(self.test_file, failures)
+        self.assertEqual([filename for filename, _ in failures], ["test_missing_image.jpg"])
+        self.assertEqual(len(deserialized_collection.images), 1)
+        self.assertEqual(deserialized_collection.current_image.filename, "slalom.jpg")
 
     def tearDown(self):
         # Delete temporary file.
@@ -1,7 +1,19 @@
 import unittest
+import io
+import re
 import os
+import shutil
+import tempfile
+import time
 from image_wrapper import Image_wrapper
+from render_cache import Render_cache
+from disk_cache import Disk_cache
+from live_preview import Live_preview
+from charsets import Charset_registry
+from dithering import Ditherer
+from edge_detector import Edge_detector
 from PIL import Image
+import exceptions
 
 class TestImageWrapper(unittest.TestCase):
     def setUp(self):
@@ -53,6 +65,430 @@ class TestImageWrapper(unittest.TestCase):
         adjusted_image = self.image._adjust_image_for_render()
         self.assertNotEqual(adjusted_image, original_image)
 
+    def test_conversion_matches_legacy(self):
+        Image_wrapper.fused_pipeline = False
+        try:
+            ascii_art = self.image._convert_to_ascii_art()
+            self.assertEqual(ascii_art, self.image._convert_to_ascii_art_legacy())
+            self.image.set_target_width("120")
+            ascii_art = self.image._convert_to_ascii_art()
+            self.assertEqual(ascii_art, self.image._convert_to_ascii_art_legacy())
+            self.assertEqual(len(ascii_art.split("\n")), self.image.target_size[1])
+        finally:
+            Image_wrapper.fused_pipeline = True
+
+    def test_fused_pipeline_matches_enhance(self):
+        for filename in ("slalom.jpg", "stadshuset.jpg"):
+            image_wrapper = Image_wrapper(filename, None, 200)
+            for brightness, contrast in (("1.0", "1.0"), ("1.3", "1.3"), ("0.5", "2.0"),
+                                         ("2.0", "0.5"), ("0", "1.0")):
+                image_wrapper.brightness = brightness
+                image_wrapper.contrast = contrast
+                fused_image, _ = image_wrapper._prepare_grayscale_image()
+                enhanced_image = image_wrapper._adjust_image_for_render()
+                differences = [abs(fused - enhanced) for fused, enhanced
+                               in zip(fused_image.tobytes(), enhanced_image.tobytes())]
+                self.assertLessEqual(max(differences), 2)
+                self.assertLess(sum(differences) / len(differences), 0.1)
+        grayscale_image = Image_wrapper("slalom.jpg", None, 200, 1.3, 0.7)
+        grayscale_image._image = grayscale_image.image.convert(mode="L")
+        fused_image, ascii_table = grayscale_image._prepare_grayscale_image()
+        enhanced_image = grayscale_image._adjust_image_for_render()
+        fused_chars = fused_image.tobytes().translate(ascii_table)
+        enhanced_chars = enhanced_image.tobytes().translate(grayscale_image._ascii_table)
+        mismatches = sum(fused != enhanced for fused, enhanced in zip(fused_chars, enhanced_chars))
+        self.assertLess(mismatches / len(fused_chars), 0.01)
+
+    def test_charsets(self):
+        self.image.set_target_width("80")
+        standard_art = self.image._get_ascii_art()
+        self.image.charset = "detailed"
+        detailed_art = self.image._get_ascii_art()
+        self.assertEqual(len(detailed_art), len(standard_art))
+        self.assertTrue(set(detailed_art) - {"\n"} <= set(Charset_registry.charsets["detailed"]))
+        self.image.charset = "blocks"
+        blocks_art = self.image._get_ascii_art()
+        Image_wrapper.fused_pipeline = False
+        try:
+            for charset in ("detailed", "blocks"):
+                self.image.charset = charset
+                self.assertEqual(self.image._convert_to_ascii_art(),
+                                 self.image._convert_to_ascii_art_legacy())
+        finally:
+            Image_wrapper.fused_pipeline = True
+        self.assertEqual([len(line) for line in blocks_art.split("\n")],
+                         [len(line) for line in standard_art.split("\n")])
+        self.image.charset = "standard"
+        self.assertEqual(self.image._get_ascii_art(), standard_art)
+        self.assertIs(Charset_registry.get_table("detailed"), Charset_registry.get_table("detailed"))
+        table = Charset_registry.get_table(Charset_registry.charsets["blocks"])
+        self.assertEqual((table[0], table[255]), (" ", "█"))
+
+    def test_dithering(self):
+        self.image.set_target_width("200")
+        plain_art = self.image._get_ascii_art()
+        grayscale_image, _ = self.image._prepare_grayscale_image()
+        level_values = Ditherer.level_values(len(self.image.charset))
+        for mode in ("floyd-steinberg", "atkinson", "bayer"):
+            self.image.dither = mode
+            dithered_image, _ = self.image._prepare_grayscale_image()
+            self.assertTrue(set(dithered_image.tobytes()) <= set(level_values))
+            # Dithering keeps the average tone.
+            self.assertAlmostEqual(sum(dithered_image.tobytes()) / len(dithered_image.tobytes()),
+                                   sum(grayscale_image.tobytes()) / len(grayscale_image.tobytes()),
+                                   delta=2)
+            dithered_art = self.image._get_ascii_art()
+            self.assertNotEqual(dithered_art, plain_art)
+            self.assertEqual([len(line) for line in dithered_art.split("\n")],
+                             [len(line) for line in plain_art.split("\n")])
+        self.image.dither = "none"
+        self.assertEqual(self.image._get_ascii_art(), plain_art)
+        with self.assertRaises(exceptions.InvalidInputError):
+            self.image.dither = "random"
+
+    def test_color_output(self):
+        self.image.set_target_width("120")
+        plain_art = self.image._get_ascii_art()
+        for color in ("ansi256", "truecolor"):
+            self.image.color = color
+            colored_art = self.image._get_ascii_art()
+            self.assertEqual(re.sub("\x1b\\[[0-9;]*m", "", colored_art), plain_art)
+            # Runs of one color share their escape code.
+            self.assertLess(colored_art.count("\x1b"), len(plain_art) / 2)
+        self.image.color = "none"
+        self.assertEqual(self.image._get_ascii_art(), plain_art)
+        self.image.render_ascii_art_to_file(self.test_render_to_filename + ".html")
+        with open("./ascii_images/" + self.test_render_to_filename + ".html") as html_file:
+            page = html_file.read()
+        os.remove("./ascii_images/" + self.test_render_to_filename + ".html")
+        self.assertTrue(page.startswith("<!DOCTYPE html>"))
+        self.assertIn("<i class=c", page)
+        with self.assertRaises(exceptions.InvalidInputError):
+            self.image.color = "cmyk"
+
+    def test_edge_detection(self):
+        split_vertically = Image.new("L", (20, 10))
+        split_vertically.paste(255, (10, 0, 20, 10))
+        split_diagonally = Image.frombytes("L", (20, 20),
+                                           bytes(255 if x + y > 20 else 0
+                                                 for y in range(20) for x in range(20)))
+        for image, glyph in ((split_vertically, "|"),
+                             (split_vertically.transpose(Image.Transpose.ROTATE_90), "-"),
+                             (split_diagonally, "/"),
+                             (split_diagonally.transpose(Image.Transpose.FLIP_LEFT_RIGHT), "\\")):
+            edge_glyphs = [code for code in Edge_detector.detect(image).flatten().tolist() if code]
+            # Corners of the diagonal's steps may get other glyphs, most must follow the edge.
+            self.assertEqual(max(set(edge_glyphs), key=edge_glyphs.count), ord(glyph))
+        self.image.set_target_width("120")
+        plain_art = self.image._get_ascii_art()
+        self.image.edges = True
+        edge_art = self.image._get_ascii_art()
+        self.assertNotEqual(edge_art, plain_art)
+        self.assertEqual([len(line) for line in edge_art.split("\n")],
+                         [len(line) for line in plain_art.split("\n")])
+        self.image.edges = False
+        self.assertEqual(self.image._get_ascii_art(), plain_art)
+
+    def test_apply_settings(self):
+        self.image.apply_settings({"width": "40", "brightness": 1.2, "charset": "blocks",
+                                   "dither": "bayer", "color": "ansi256", "edges": "on",
+                                   "format": "html"})
+        self.assertEqual((self.image.target_size[0], self.image.brightness, self.image.charset,
+                          self.image.dither, self.image.color, self.image.edges),
+                         (40, 1.2, " ░▒▓█", "bayer", "ansi256", True))
+        self.image.apply_settings({"edges": False})
+        self.assertFalse(self.image.edges)
+        with self.assertRaises(exceptions.InvalidInputError):
+            self.image.apply_settings({"height": "0"})
+
+    def test_render_cache(self):
+        cache = Image_wrapper.render_cache
+        cache.clear()
+        first_render = self.image._get_ascii_art()
+        self.assertEqual(self.image._get_ascii_art(), first_render)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.image.brightness = "0.5"
+        self.assertEqual(len(cache), 0)
+        self.assertNotEqual(self.image._get_ascii_art(), first_render)
+        self.assertEqual(cache.misses, 2)
+
+    def test_disk_cache(self):
+        cache_directory = tempfile.mkdtemp()
+        Image_wrapper.disk_cache = Disk_cache(cache_directory)
+        try:
+            first_render = self.image._get_ascii_art()
+            self.assertEqual(Image_wrapper.disk_cache.misses, 1)
+            # Another run: a new process has an empty render cache and its own Disk_cache.
+            Image_wrapper.render_cache.clear()
+            Image_wrapper.disk_cache = Disk_cache(cache_directory)
+            same_image = Image_wrapper("slalom.jpg", None, 50, 1.3, 1.3, lazy=True)
+            self.assertEqual(same_image._get_ascii_art(), first_render)
+            self.assertEqual(Image_wrapper.disk_cache.hits, 1)
+            self.assertFalse(same_image.is_decoded)  # Served without decoding.
+            same_image.charset = "blocks"
+            self.assertNotEqual(same_image._get_ascii_art(), first_render)
+            # Legacy renders ignore color, so they aren't stored under a color key.
+            same_image.color = "truecolor"
+            Image_wrapper.legacy_conversion = True
+            try:
+                self.assertIsNone(same_image._disk_key())
+            finally:
+                Image_wrapper.legacy_conversion = False
+            self.assertIn("\x1b[", same_image._get_ascii_art())
+            # Least recently used renders go first once the cache is too large.
+            render_size = len(first_render.encode("utf-8"))
+            disk_cache = Disk_cache(cache_directory, max_bytes=render_size * 3)
+            for key in ("a1", "b2", "c3"):
+                disk_cache.put(key, first_render)
+            disk_cache.get("a1")
+            os.utime(os.path.join(cache_directory, "renders", "a1", "a1.txt"),
+                     ns=(0, time.time_ns() + 10**9))  # Used last, even on coarse clocks.
+            disk_cache.put("d4", first_render)
+            self.assertIsNotNone(disk_cache.get("a1"))
+            self.assertIsNone(disk_cache.get("b2"))
+            self.assertIsNotNone(disk_cache.get("d4"))
+            # Source digests are cached files too, and temporary files leave none.
+            disk_cache.clear()
+            disk_cache.source_digest("stadshuset.jpg", persist=False)
+            self.assertEqual(disk_cache._list_renders(), [])
+            disk_cache.source_digest("stadshuset.jpg")
+            self.assertEqual(len(disk_cache._list_renders()), 1)
+            disk_cache.clear()
+            self.assertEqual(disk_cache._list_renders(), [])
+            self.assertEqual(os.listdir(cache_directory), ["renders"])
+        finally:
+            Image_wrapper.disk_cache = None
+            shutil.rmtree(cache_directory)
+
+    def test_disk_cache_skips_replaced_source(self):
+        cache_directory = tempfile.mkdtemp()
+        Image_wrapper.disk_cache = Disk_cache(cache_directory)
+        shutil.copy("slalom.jpg", "test_replaced_image.jpg")
+        try:
+            decoded_image = Image_wrapper("test_replaced_image.jpg", None, 50, lazy=False)
+            shutil.copy("stadshuset.jpg", "test_replaced_image.jpg")  # Replaced after decoding.
+            decoded_image._get_ascii_art()
+            self.assertEqual(os.listdir(cache_directory), [])  # Old pixels, not stored.
+            # Another run renders the new file, not the old pixels.
+            Image_wrapper.disk_cache = Disk_cache(cache_directory)
+            new_image = Image_wrapper("test_replaced_image.jpg", None, 50, lazy=True)
+            self.assertEqual(new_image._get_ascii_art(),
+                             Image_wrapper("stadshuset.jpg", None, 50)._convert_to_ascii_art())
+            self.assertEqual(Image_wrapper.disk_cache.hits, 0)
+        finally:
+            Image_wrapper.disk_cache = None
+            shutil.rmtree(cache_directory)
+            os.remove("test_replaced_image.jpg")
+
+    def test_render_cache_eviction(self):
+        cache = Render_cache(max_entries=2)
+        cache.put((0, "a"), "a")
+        cache.put((0, "b"), "b")
+        cache.get((0, "a"))
+        cache.put((1, "c"), "c")
+        self.assertIsNone(cache.get((0, "b")))
+        self.assertEqual(cache.get((0, "a")), "a")
+        cache.invalidate(0)
+        self.assertEqual(len(cache), 1)
+        cache.reset_counters()
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (0, 0, 1))
+
+    def test_lazy_loading(self):
+        lazy_image = Image_wrapper("slalom.jpg", None, 50, 1.3, 1.3, lazy=True)
+        self.assertFalse(lazy_image.is_decoded)
+        self.assertEqual(lazy_image.size, self.image.size)
+        self.assertEqual(lazy_image.target_size, self.image.target_size)
+        self.assertEqual(lazy_image._convert_to_ascii_art(),
+                         self.image._convert_to_ascii_art())
+        self.assertTrue(lazy_image.is_decoded)
+        lazy_image.release_pixels()
+        self.assertFalse(lazy_image.is_decoded)
+
+    def test_memory_budget(self):
+        first_image = Image_wrapper("slalom.jpg", None, lazy=True)
+        second_image = Image_wrapper("stadshuset.jpg", None, lazy=True)
+        try:
+            Image_wrapper.memory_budget = 1
+            first_image._convert_to_ascii_art()
+            second_image._convert_to_ascii_art()
+            self.assertFalse(first_image.is_decoded)
+            self.assertTrue(second_image.is_decoded)
+        finally:
+            Image_wrapper.memory_budget = None
+
+    def test_draft_decoding(self):
+        large_filename = "test_large_image.jpg"
+        Image.new("RGB", (4000, 3000), (200, 120, 40)).save(large_filename)
+        try:
+            large_image = Image_wrapper(large_filename, None)
+            self.assertIsNone(large_image._image)
+            self.assertLessEqual(large_image._draft.width, 4000 // 8)
+            self.assertGreaterEqual(large_image._draft.width, 100)
+            draft_render = large_image._convert_to_ascii_art()
+            large_image.image  # Decodes the full image.
+            self.assertEqual(large_image._convert_to_ascii_art(), draft_render)
+            detailed_image = Image_wrapper("slalom.jpg", None)
+            detailed_image.set_target_width("500")
+            self.assertEqual(detailed_image._get_render_source().size, detailed_image.size)
+        finally:
+            os.remove(large_filename)
+
+    def test_streamed_render(self):
+        self.image.set_target_width("200")
+        ascii_art = self.image._convert_to_ascii_art()
+        Image_wrapper.stream_threshold = 0
+        try:
+            ascii_blocks = list(self.image._iter_ascii_art())
+        finally:
+            Image_wrapper.stream_threshold = 250_000
+        self.assertGreater(len(ascii_blocks), 1)
+        self.assertTrue(all(len(block.split("\n")) <= Image_wrapper.stream_block_rows + 1
+                            for block in ascii_blocks))
+        self.assertEqual("".join(ascii_blocks), ascii_art + "\n")
+
+    def test_render_stats(self):
+        render_stats = Image_wrapper.render_stats
+        render_stats.reset()
+        self.image._convert_to_ascii_art()
+        self.assertEqual(render_stats.to_dict(Image_wrapper.render_cache)["images"], {})
+        render_stats.enabled = True
+        try:
+            self.image.charset = "blocks"
+            self.image.render_ascii_art_to_file(self.test_render_to_filename)
+        finally:
+            render_stats.enabled = False
+        image_stats = render_stats.to_dict(Image_wrapper.render_cache)["images"]["slalom.jpg"]
+        self.assertEqual(image_stats["bytes_written"],
+                         os.path.getsize(f"./ascii_images/{self.test_render_to_filename}.txt"))
+        for stage in ("resize", "brightness_contrast", "grayscale", "char_mapping", "write"):
+            self.assertEqual(image_stats["stages"][stage]["calls"], 1)
+
+    def test_mapped_grayscale_images(self):
+        grayscale_image = Image.open("slalom.jpg").convert(mode="L")
+        grayscale_image.save("test_mapped_image.pgm")
+        grayscale_image.save("test_mapped_image.png")
+        raw_filename = f"test_mapped_image_{grayscale_image.width}x{grayscale_image.height}.raw"
+        with open(raw_filename, "wb") as raw_file:
+            raw_file.write(grayscale_image.tobytes())
+        try:
+            decoded_image = Image_wrapper("test_mapped_image.png", None, 80)
+            for filename in ("test_mapped_image.pgm", raw_filename):
+                mapped_image = Image_wrapper(filename, None, 80)
+                self.assertEqual(mapped_image.size, grayscale_image.size)
+                self.assertTrue(mapped_image.image.readonly)  # Views the mapped file.
+                self.assertEqual(mapped_image._pixel_bytes(), 0)
+                self.assertEqual(mapped_image._convert_to_ascii_art(),
+                                 decoded_image._convert_to_ascii_art())
+                del mapped_image
+            with self.assertRaises(exceptions.InvalidInputError):
+                Image_wrapper("test_mapped_image.raw", None)
+        finally:
+            for filename in ("test_mapped_image.pgm", "test_mapped_image.png", raw_filename):
+                os.remove(filename)
+
+    def test_tiled_render(self):
+        grayscale_image = Image.open("stadshuset.jpg").convert(mode="L").resize((3200, 2130))
+        grayscale_image.save("test_tiled_image.pgm")
+        try:
+            tiled_image = Image_wrapper("test_tiled_image.pgm", None, 300, 1.2, 1.4)
+            ascii_art = tiled_image._convert_to_ascii_art()
+            Image_wrapper.tiled_source_pixels = 1_000_000
+            try:
+                ascii_blocks = list(tiled_image._iter_ascii_art())
+            finally:
+                Image_wrapper.tiled_source_pixels = 50_000_000
+            self.assertGreater(len(ascii_blocks), 5)
+            tiled_ascii_art = "".join(ascii_blocks)[:-1]
+            self.assertEqual(len(tiled_ascii_art), len(ascii_art))
+            mismatches = sum(char != other_char for char, other_char
+                             in zip(tiled_ascii_art, ascii_art))
+            self.assertLess(mismatches / len(ascii_art), 0.02)
+            del tiled_image
+        finally:
+            os.remove("test_tiled_image.pgm")
+
+    def test_tiled_render_has_no_seams(self):
+        # A horizontal edge right at the border of the first band (35 rows).
+        edge_image = Image.new("L", (400, 400), 255)
+        edge_image.paste(0, (0, 255, 400, 400))
+        edge_image.save("test_seam_image.pgm")
+        try:
+            seam_image = Image_wrapper("test_seam_image.pgm", None, 100)
+            seam_image.edges = True
+            ascii_art = seam_image._convert_to_ascii_art()
+            seam_image.dither = "atkinson"
+            Image_wrapper.tiled_source_pixels = 1000
+            try:
+                tiled_ascii_art = "".join(seam_image._iter_ascii_art())[:-1]
+            finally:
+                Image_wrapper.tiled_source_pixels = 50_000_000
+            self.assertIn("-", ascii_art)
+            self.assertEqual(tiled_ascii_art, ascii_art)  # Edges found, bands not dithered.
+            del seam_image
+        finally:
+            os.remove("test_seam_image.pgm")
+
+    def test_animated_frames(self):
+        frames = [Image.new("RGB", (120, 80), color)
+                  for color in ((0, 0, 0), (0, 0, 0), (255, 255, 255))]
+        # Multi-page TIFF keeps repeated pages (GIF would merge them).
+        frames[0].save("test_animation.tiff", save_all=True, append_images=frames[1:])
+        frames[1].save("test_animation.gif", save_all=True, append_images=frames[2:],
+                       duration=[40, 60])
+        try:
+            animated_image = Image_wrapper("test_animation.tiff", None, 20)
+            self.assertEqual(animated_image.frame_count, 3)
+            converted_sources = []
+            convert = animated_image._convert_source_to_ascii_art
+            animated_image._convert_source_to_ascii_art = (
+                lambda source: converted_sources.append(source) or convert(source))
+            rendered_frames = list(animated_image._iter_frames())
+            self.assertEqual(len(rendered_frames), 3)
+            self.assertEqual(len(converted_sources), 2)  # The repeated frame is reused.
+            self.assertEqual(set(rendered_frames[0][0]), {" ", "\n"})
+            self.assertEqual(set(rendered_frames[2][0]), {"@", "\n"})
+            self.assertEqual(animated_image.render_frames_to_directory("test_frames"), 3)
+            self.assertTrue(os.path.exists("./ascii_images/test_frames/frame_0003.txt"))
+            gif_image = Image_wrapper("test_animation.gif", None, 20)
+            self.assertEqual([duration for _, duration in gif_image._iter_frames()], [40, 60])
+        finally:
+            os.remove("test_animation.tiff")
+            os.remove("test_animation.gif")
+            shutil.rmtree("./ascii_images/test_frames", ignore_errors=True)
+
+    def test_palette_image_matches_first_frame(self):
+        Image.open("stadshuset.jpg").save("test_palette_image.gif")
+        try:
+            palette_image = Image_wrapper("test_palette_image.gif", None, 60)
+            self.assertEqual(palette_image.mode, "P")
+            first_frame, _ = next(palette_image._iter_frames())
+            self.assertEqual(palette_image._convert_to_ascii_art(), first_frame)
+        finally:
+            os.remove("test_palette_image.gif")
+
+    def test_live_preview_redraws_changes(self):
+        stream = io.StringIO()
+        live_preview = Live_preview(stream)
+        self.image.set_target_width("120")
+        self.image.render_ascii_art_to_preview(live_preview)
+        full_draw = stream.getvalue()
+        self.assertIn(self.image._get_ascii_art(), full_draw)
+        stream.truncate(0)
+        stream.seek(0)
+        self.image.render_ascii_art_to_preview(live_preview)
+        self.assertLess(len(stream.getvalue()), 20)  # Only moves the cursor below the frame.
+        self.image.contrast = "1.4"
+        stream.truncate(0)
+        stream.seek(0)
+        self.image.render_ascii_art_to_preview(live_preview)
+        self.assertLess(len(stream.getvalue()), len(full_draw))
+        self.assertEqual(Live_preview._changed_spans("abcdefghijklmnopqrst", "Xbcdefghijklmnopqrsu"),
+                         [[0, 1], [19, 20]])
+        self.assertEqual(Live_preview._changed_spans("abcdef", "XbXdef"), [[0, 3]])
+        live_preview.draw("\x1b[38;5;1mab\x1b[0m\ncd")
+        # Split into two runs: longer with color codes but the same size on screen.
+        self.assertNotIn("\x1b[2J", live_preview.draw("\x1b[38;5;1ma\x1b[38;5;2mb\x1b[0m\ncd"))
+
     def test_render_ascii_art_to_file(self):
         self.image.render_ascii_art_to_file(self.test_render_to_filename)
         self.assertTrue(os.path.exists("./ascii_images/" 
@@ -0,0 +1,54 @@
+import unittest
+import io
+import os
+from contextlib import redirect_stderr, redirect_stdout
+from command_handler import Command_handler
+from image_collection import Image_collection
+from image_wrapper import Image_wrapper
+from main import run_batch
+
+class TestRunBatch(unittest.TestCase):
+    def setUp(self):
+        Command_handler.image_collection = Image_collection()
+        self.test_script = "test_batch_script.txt"
+
+    def run_script(self, lines: list, stop_on_error: bool=False) -> tuple:
+        with open(self.test_script, "w") as script_file:
+            script_file.write("\n".join(lines) + "\n")
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            exit_code = run_batch(self.test_script, [], stop_on_error)
+        return exit_code, stdout.getvalue(), stderr.getvalue()
+
+    def test_exit_codes(self):
+        exit_code, stdout, stderr = self.run_script(["# A comment", "", "stats off"])
+        self.assertEqual((exit_code, stderr), (0, ""))  # Comments and blank lines are skipped.
+        self.assertIn("Collection is off", stdout)
+        exit_code, stdout, stderr = self.run_script(["an invalid command", "stats off"])
+        self.assertEqual(exit_code, 1)
+        self.assertTrue(stderr.startswith("line 1: "))
+        self.assertIn("Collection is off", stdout)  # The next command still ran.
+        stderr = io.StringIO()
+        with redirect_stderr(stderr):
+            self.assertEqual(run_batch("missing_script.txt", [], False), 2)
+        self.assertIn("missing_script.txt", stderr.getvalue())
+
+    def test_stop_on_error(self):
+        exit_code, stdout, _ = self.run_script(["an invalid command", "stats off"],
+                                               stop_on_error=True)
+        self.assertEqual(exit_code, 1)
+        self.assertEqual(stdout, "")
+
+    def test_quit(self):
+        exit_code, stdout, stderr = self.run_script(["stats off", "quit", "an invalid command"])
+        self.assertEqual((exit_code, stderr), (0, ""))
+        self.assertNotIn("Program shutting down", stdout)  # Would mix into piped output.
+
+    def tearDown(self):
+        Command_handler.quiet_exit = False
+        Image_wrapper.render_stats.enabled = False
+        if os.path.exists(self.test_script):
+            os.remove(self.test_script)
+
+if __name__ == '__main__':
+    unittest.main()
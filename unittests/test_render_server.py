@@ -0,0 +1,75 @@
+import unittest
+import json
+import threading
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+from render_server import Render_server
+
+class TestRenderServer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        Render_server.max_workers = 1
+        # Assumes image-file "slalom.jpg" is in cwd.
+        cls.render_server = Render_server(port=0)
+        cls.render_server.start_workers()
+        cls.server_thread = threading.Thread(target=cls.render_server.serve_forever)
+        cls.server_thread.start()
+        host, port = cls.render_server.address
+        cls.base_url = f"http://{host}:{port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.render_server.shutdown()
+        cls.server_thread.join()
+        Render_server.max_workers = None
+
+    def test_render_path(self):
+        with urlopen(self.base_url + "/render?path=slalom.jpg&width=40&charset=detailed") as response:
+            ascii_art = response.read().decode("utf-8")
+            self.assertEqual(response.headers["X-Render-Cache"], "miss")
+        self.assertEqual(len(ascii_art.splitlines()[0]), 40)
+        with urlopen(self.base_url + "/render?path=slalom.jpg&charset=detailed&width=40") as response:
+            self.assertEqual(response.read().decode("utf-8"), ascii_art)
+            self.assertEqual(response.headers["X-Render-Cache"], "hit")
+
+    def test_render_upload(self):
+        with open("slalom.jpg", "rb") as image_file:
+            upload = image_file.read()
+        with urlopen(Request(self.base_url + "/render?width=30", data=upload)) as response:
+            self.assertEqual(len(response.read().decode("utf-8").splitlines()[0]), 30)
+
+    def test_errors(self):
+        for query, status in (("path=../slalom.jpg", 403), ("path=missing.jpg", 404),
+                              ("path=slalom.jpg&width=wide", 400),
+                              ("path=slalom.jpg&dither=random", 400),
+                              ("width=40", 400), ("path=.", 404)):
+            with self.assertRaises(HTTPError) as context:
+                urlopen(self.base_url + "/render?" + query)
+            self.assertEqual(context.exception.code, status)
+            context.exception.close()
+        with self.assertRaises(HTTPError) as context:
+            urlopen(self.base_url + "/render?path=slalom.jpg&width=0")
+        self.assertIn(b"width must be a positive integer", context.exception.read())
+        context.exception.close()
+
+    def test_backpressure_and_metrics(self):
+        acquired = 0
+        while self.render_server.try_acquire():
+            acquired += 1  # Occupy every pending slot.
+        try:
+            with self.assertRaises(HTTPError) as context:
+                urlopen(self.base_url + "/render?path=slalom.jpg")
+            self.assertEqual(context.exception.code, 503)
+            self.assertEqual(context.exception.headers["Retry-After"], "1")
+            context.exception.close()
+        finally:
+            for _ in range(acquired):
+                self.render_server.release(0.0, "cached")
+        with urlopen(self.base_url + "/metrics") as response:
+            metrics = json.load(response)
+        self.assertGreaterEqual(metrics["rejected"], 1)
+        self.assertEqual(metrics["in_flight"], 0)
+        self.assertIsNotNone(metrics["latency_ms"]["p95"])
+
+if __name__ == '__main__':
+    unittest.main()